@@ -12,14 +12,20 @@ export default function App() {
   const {
     memoData,
     isLoading,
+    isStreaming,
     error,
     analyzeData,
+    analyzeFile,
   } = useLoanAnalyzer();
 
   const handleAnalysisRequest = async (fileContent: string) => {
     await analyzeData(fileContent);
   };
 
+  const handleFileAnalysisRequest = async (file: File) => {
+    await analyzeFile(file);
+  };
+
   return (
     <div className="min-h-screen bg-gray-900 font-sans">
       <Header />
@@ -34,7 +40,8 @@ export default function App() {
             </p>
             <LoanAnalysisForm
               onSubmit={handleAnalysisRequest}
-              isLoading={isLoading}
+              onSubmitFile={handleFileAnalysisRequest}
+              isLoading={isLoading || isStreaming}
             />
           </div>
 
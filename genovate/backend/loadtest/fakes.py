@@ -0,0 +1,122 @@
+import asyncio
+import concurrent.futures
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+
+@dataclass
+class LatencyProfile:
+    """
+    Latency and error distribution of a fake dependency. Latencies are log-normal
+    around `median_seconds` (`sigma` 0 makes them constant), and each call fails
+    with probability `error_rate`.
+    """
+    median_seconds: float
+    sigma: float = 0.5
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+
+    def sampler(self) -> "LatencySampler":
+        return LatencySampler(self)
+
+
+class LatencySampler:
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+        self._random = random.Random(profile.seed)
+
+    def latency(self) -> float:
+        return self.profile.median_seconds * math.exp(self.profile.sigma * self._random.gauss(0, 1))
+
+    def fails(self) -> bool:
+        return self._random.random() < self.profile.error_rate
+
+
+class FakeQueryJob:
+    """Stands in for a bigquery.QueryJob: `result()` blocks like the real client does."""
+
+    def __init__(self, rows: List[dict], latency: float, error: Optional[Exception], bytes_processed: int):
+        self._rows = rows
+        self._latency = latency
+        self._error = error
+        self.total_bytes_processed = bytes_processed
+
+    def result(self, timeout: Optional[float] = None, page_size: Optional[int] = None) -> List[dict]:
+        if timeout is not None and self._latency > timeout:
+            time.sleep(timeout)
+            raise concurrent.futures.TimeoutError()
+        time.sleep(self._latency)
+        if self._error is not None:
+            raise self._error
+        return self._rows
+
+
+class FakeBigQueryClient:
+    """
+    Stands in for bigquery.Client in the enrichment path. Every query returns a few
+    plausible rows after a latency drawn from `profile`; failures raise
+    ServiceUnavailable, which the governor treats as retryable.
+    """
+
+    def __init__(self, profile: LatencyProfile, rows_per_query: int = 5):
+        self.profile = profile
+        self.rows_per_query = rows_per_query
+        self._sampler = profile.sampler()
+        self.queries = 0
+
+    def query(self, sql: str, job_config=None, timeout: Optional[float] = None) -> FakeQueryJob:
+        from google.api_core.exceptions import ServiceUnavailable
+
+        self.queries += 1
+        error = ServiceUnavailable("Fake BigQuery backend error") if self._sampler.fails() else None
+        rows = [
+            {"city": "Anytown", "state": "CA", "price": 500000 + 25000 * i, "sqft": 1800 + 100 * i}
+            for i in range(self.rows_per_query)
+        ]
+        return FakeQueryJob(rows, self._sampler.latency(), error, bytes_processed=10 * 1024 * 1024)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAnalysisChain:
+    """
+    Stands in for the prompt | Gemini | parser chain. `ainvoke` waits for a latency
+    drawn from `profile` and returns a canned memo; `astream` spreads the same
+    latency over `chunks` chunks. Failures raise ResourceExhausted, like a quota error.
+    """
+
+    MEMO = "## Deal Memo\n\nThis memo was written by the load-test stand-in for Gemini.\n"
+
+    def __init__(self, profile: LatencyProfile, chunks: int = 20):
+        self.profile = profile
+        self.chunks = chunks
+        self._sampler = profile.sampler()
+        self.calls = 0
+
+    def _error(self) -> Optional[Exception]:
+        from google.api_core.exceptions import ResourceExhausted
+
+        return ResourceExhausted("Fake Gemini quota exceeded") if self._sampler.fails() else None
+
+    async def ainvoke(self, inputs: dict, config=None) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._sampler.latency())
+        error = self._error()
+        if error is not None:
+            raise error
+        return self.MEMO
+
+    async def astream(self, inputs: dict, config=None) -> AsyncIterator[str]:
+        self.calls += 1
+        error = self._error()
+        delay = self._sampler.latency() / self.chunks
+        size = math.ceil(len(self.MEMO) / self.chunks)
+        for index in range(self.chunks):
+            await asyncio.sleep(delay)
+            if error is not None and index == self.chunks // 2:
+                raise error
+            yield self.MEMO[index * size:(index + 1) * size]
@@ -0,0 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from loadtest.fakes import FakeAnalysisChain, FakeBigQueryClient, LatencyProfile
+from services.analysis_service import get_analysis_memo
+from services.clients import ServiceClients
+from services.job_queue import JobQueue
+
+
+def fake_service_clients(bigquery_profile: LatencyProfile, llm_profile: LatencyProfile) -> ServiceClients:
+    """Shared clients backed by the BigQuery and Gemini stand-ins."""
+    return ServiceClients(
+        bigquery_client=FakeBigQueryClient(bigquery_profile),
+        analysis_chain=FakeAnalysisChain(llm_profile),
+    )
+
+
+def fake_lifespan(clients: ServiceClients):
+    """
+    A replacement for `main.lifespan` that injects `clients` instead of creating the
+    real BigQuery client and Gemini chain. Everything else (dependencies, caches,
+    governors, the job queue) runs as in production.
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        clients_ready = asyncio.get_running_loop().create_future()
+        clients_ready.set_result(clients)
+        app.state.clients_ready = clients_ready
+        app.state.job_queue = JobQueue(lambda file_content: get_analysis_memo(
+            file_content,
+            enrichment_client=clients.enrichment_client,
+            chain=clients.analysis_chain,
+        ))
+        await app.state.job_queue.start()
+        yield
+        await app.state.job_queue.stop()
+
+    return lifespan
+
+
+def install_fakes(app: FastAPI, clients: ServiceClients) -> None:
+    """Makes `app` use the stand-in clients the next time its lifespan runs."""
+    app.router.lifespan_context = fake_lifespan(clients)
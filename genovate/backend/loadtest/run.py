@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+from loadtest.fakes import LatencyProfile
+
+# Documents rotate through these locations, so the enrichment cache sees a realistic
+# mix of hits and misses while every memo is a cache miss.
+LOCATIONS = [
+    ("Anytown", "CA", "90210"), ("Austin", "TX", "78701"), ("Denver", "CO", "80202"),
+    ("Miami", "FL", "33101"), ("Seattle", "WA", "98101"), ("Chicago", "IL", "60601"),
+    ("Boston", "MA", "02108"), ("Phoenix", "AZ", "85001"), ("Atlanta", "GA", "30303"),
+    ("Portland", "OR", "97201"), ("Nashville", "TN", "37201"), ("Columbus", "OH", "43215"),
+]
+PROPERTY_TYPES = ["office", "retail", "industrial", "multifamily"]
+# A level regresses when p95 latency rises, or throughput falls, by more than this fraction.
+DEFAULT_TOLERANCE = 0.2
+
+
+def _document(run: str, index: int) -> str:
+    city, state, zip_code = LOCATIONS[index % len(LOCATIONS)]
+    property_type = PROPERTY_TYPES[index % len(PROPERTY_TYPES)]
+    sqft = 5000 + 2500 * (index % 17)
+    return (
+        f"Offering Memorandum {run}-{index}\n\n"
+        f"A {sqft:,} sqft {property_type} property at 100 Main St, {city}, {state} {zip_code}.\n"
+        f"NOI for 2024 was $1,245,000 with occupancy of 94% and leases averaging 6.2 years.\n"
+    )
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def _run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, total_requests: int) -> dict:
+    """Sends `total_requests` documents to `endpoint` from `concurrency` concurrent clients."""
+    run = f"c{concurrency}-{time.time_ns()}"
+    next_index = iter(range(total_requests))
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for index in next_index:
+            started = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json={"file_content": _document(run, index)})
+                ok = response.status_code == 200 and "event: error" not in response.text
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "requests_per_second": round(total_requests / elapsed, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+    }
+
+
+async def run_load_test(
+    concurrency_levels: List[int],
+    requests_per_level: int,
+    bigquery_profile: LatencyProfile,
+    llm_profile: LatencyProfile,
+    endpoint: str = "/analyze",
+    url: Optional[str] = None,
+) -> List[dict]:
+    """
+    Runs one load level per entry of `concurrency_levels` and returns their latency
+    percentiles and throughput. Without `url`, the app runs in-process against the
+    BigQuery and Gemini stand-ins; with it, requests go to a running server (e.g.
+    one started with `python -m loadtest.run serve`). Caches are cleared between levels.
+    """
+    import main
+    from loadtest.harness import fake_lifespan, fake_service_clients
+    from services.analysis_service import invalidate_enrichment_cache, invalidate_memo_cache
+
+    results = []
+    if url is not None:
+        async with httpx.AsyncClient(base_url=url, timeout=300) as client:
+            for concurrency in concurrency_levels:
+                await client.post("/cache/invalidate")
+                results.append(await _run_level(client, endpoint, concurrency, requests_per_level))
+        return results
+
+    os.environ.setdefault("API_KEY", "load-test")
+    os.environ.setdefault("GCP_PROJECT_ID", "load-test")
+    lifespan = fake_lifespan(fake_service_clients(bigquery_profile, llm_profile))
+    transport = httpx.ASGITransport(app=main.app)
+    async with lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=300) as client:
+            for concurrency in concurrency_levels:
+                invalidate_enrichment_cache()
+                invalidate_memo_cache()
+                results.append(await _run_level(client, endpoint, concurrency, requests_per_level))
+    return results
+
+
+def compare_to_baseline(results: List[dict], baseline: List[dict], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Returns a description of every level whose p95 latency or throughput regressed past `tolerance`."""
+    baseline_by_level = {level["concurrency"]: level for level in baseline}
+    regressions = []
+    for level in results:
+        before = baseline_by_level.get(level["concurrency"])
+        if before is None:
+            continue
+        if level["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"concurrency {level['concurrency']}: p95 {before['p95_ms']} ms -> {level['p95_ms']} ms")
+        if level["requests_per_second"] < before["requests_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"concurrency {level['concurrency']}: {before['requests_per_second']} -> {level['requests_per_second']} req/s"
+            )
+    return regressions
+
+
+def format_results(results: List[dict]) -> str:
+    columns = ["concurrency", "requests", "errors", "requests_per_second", "p50_ms", "p95_ms", "p99_ms"]
+    lines = [" | ".join(columns)]
+    for level in results:
+        lines.append(" | ".join(str(level[column]) for column in columns))
+    return "\n".join(lines)
+
+
+def _profiles(args) -> tuple:
+    return (
+        LatencyProfile(args.bq_median, args.bq_sigma, args.bq_error_rate, seed=args.seed),
+        LatencyProfile(args.llm_median, args.llm_sigma, args.llm_error_rate, seed=args.seed),
+    )
+
+
+if __name__ == '__main__':
+    # From the backend directory:
+    #   python -m loadtest.run run --concurrency 1,8,32 --requests 200 --output results.json
+    #   python -m loadtest.run run --baseline results.json      # exits 1 on regression
+    #   python -m loadtest.run serve --port 8001                 # real server on the stand-ins
+    #   python -m loadtest.run run --url http://127.0.0.1:8001
+    parser = argparse.ArgumentParser(description="Load-test /analyze against BigQuery and Gemini stand-ins.")
+    parser.add_argument("command", choices=["run", "serve"])
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level.")
+    parser.add_argument("--endpoint", default="/analyze", choices=["/analyze", "/analyze/stream"])
+    parser.add_argument("--url", help="Load-test a running server instead of an in-process app.")
+    parser.add_argument("--bq-median", type=float, default=0.3, help="Median BigQuery query latency in seconds.")
+    parser.add_argument("--bq-sigma", type=float, default=0.5)
+    parser.add_argument("--bq-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-median", type=float, default=3.0, help="Median Gemini call latency in seconds.")
+    parser.add_argument("--llm-sigma", type=float, default=0.4)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against results previously written with --output.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    bigquery_profile, llm_profile = _profiles(args)
+
+    if args.command == "serve":
+        import uvicorn
+
+        import main
+        from loadtest.harness import fake_service_clients, install_fakes
+
+        os.environ.setdefault("API_KEY", "load-test")
+        os.environ.setdefault("GCP_PROJECT_ID", "load-test")
+        install_fakes(main.app, fake_service_clients(bigquery_profile, llm_profile))
+        uvicorn.run(main.app, port=args.port)
+        sys.exit(0)
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = asyncio.run(run_load_test(levels, args.requests, bigquery_profile, llm_profile, args.endpoint, args.url))
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -1,30 +1,100 @@
 
+import asyncio
+import json
 import os
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from services.analysis_service import get_analysis_memo
+from services.analysis_service import (
+    COMPS_INDEX_REFRESH_SECONDS,
+    get_comps_index_stats,
+    get_analysis_memo,
+    get_batch_analysis_memos,
+    get_enrichment_cache_stats,
+    get_memo_cache_stats,
+    invalidate_enrichment_cache,
+    refresh_comps_index,
+    stream_analysis_memo,
+)
+from services.batch_jobs import BatchJobStore
+from services.clients import ServiceClients, close_service_clients, create_service_clients
+from services.governor import CircuitOpenError, get_governor_stats, is_retryable
+from services.job_queue import MAX_PRIORITY, MIN_PRIORITY, JobQueue, QueueFullError
+from services.ingestion import UploadError, extract_text_from_upload
+from services.metrics import render_metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(
-    title="AI Commercial Real Estate Analyst API",
-    description="An API that uses Google Gemini and BigQuery to analyze real estate data.",
-    version="1.0.0"
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the shared BigQuery client and Gemini chain once per process and starts
+    the job queue workers. The clients are created and warmed up in the background,
+    so /health answers straight away; /ready reports when they are done. With
+    COMPS_INDEX_REFRESH_SECONDS set, the comparables index is also kept loaded.
+    """
+    app.state.clients_ready = asyncio.create_task(create_service_clients())
+
+    async def run_queued_analysis(file_content: str) -> str:
+        clients = await asyncio.shield(app.state.clients_ready)
+        return await get_analysis_memo(
+            file_content,
+            enrichment_client=clients.enrichment_client,
+            chain=clients.analysis_chain,
+        )
+
+    app.state.job_queue = JobQueue(run_queued_analysis)
+    await app.state.job_queue.start()
+
+    async def refresh_comps_index_periodically():
+        clients = await asyncio.shield(app.state.clients_ready)
+        while True:
+            try:
+                await refresh_comps_index(clients.enrichment_client)
+            except Exception as e:
+                print(f"Comparables index refresh failed: {e}")
+            await asyncio.sleep(COMPS_INDEX_REFRESH_SECONDS)
+
+    comps_refresh = None
+    if COMPS_INDEX_REFRESH_SECONDS > 0:
+        comps_refresh = asyncio.create_task(refresh_comps_index_periodically())
 
-@app.on_event("startup")
-async def startup_event():
-    """Prints a confirmation message when the server starts."""
     print("\n--- AI Real Estate Analyst Backend ---")
     print("Server is running.")
     print("API URL: http://127.0.0.1:8000")
     print("Health Check: http://127.0.0.1:8000/health")
+    print("Readiness Check: http://127.0.0.1:8000/ready")
     print("-------------------------------------\n")
 
+    yield
+
+    if comps_refresh is not None:
+        comps_refresh.cancel()
+    await batch_jobs.cancel_all()
+    await app.state.job_queue.stop()
+    close_service_clients(await app.state.clients_ready)
+
+app = FastAPI(
+    title="AI Commercial Real Estate Analyst API",
+    description="An API that uses Google Gemini and BigQuery to analyze real estate data.",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+async def get_service_clients(request: Request) -> ServiceClients:
+    """Returns the clients created by the lifespan handler, waiting for them if they are still warming up."""
+    clients_ready = getattr(request.app.state, "clients_ready", None)
+    if clients_ready is None:
+        return ServiceClients()
+    return await asyncio.shield(clients_ready)
+
 
 # Configure CORS to allow requests from the frontend
 origins = [
@@ -43,36 +113,298 @@ app.add_middleware(
 class AnalysisRequest(BaseModel):
     file_content: str
 
+class BatchDocument(BaseModel):
+    id: Optional[str] = None
+    file_content: str
+
+class BatchAnalysisRequest(BaseModel):
+    documents: List[BatchDocument]
+
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", "500"))
+batch_jobs = BatchJobStore()
+
 @app.get("/health")
 def health_check():
     """A simple endpoint to check if the server is running."""
     return {"status": "ok"}
 
+@app.get("/ready")
+def readiness_check(request: Request, response: Response):
+    """
+    Reports whether the shared clients have been created and warmed up. Returns 503
+    until then, and if the enrichment client or the Gemini chain could not be
+    created, so a load balancer only routes analysis traffic to working instances.
+    """
+    clients_ready = getattr(request.app.state, "clients_ready", None)
+    if clients_ready is None or not clients_ready.done():
+        response.status_code = 503
+        return {"status": "warming_up"}
+    if clients_ready.cancelled() or clients_ready.exception() is not None:
+        response.status_code = 503
+        return {"status": "failed"}
+    clients = clients_ready.result()
+    available = {
+        "enrichment_client": clients.enrichment_client is not None,
+        "analysis_chain": clients.analysis_chain is not None,
+    }
+    # create_service_clients leaves a client it could not create as None.
+    if not all(available.values()):
+        response.status_code = 503
+        return {"status": "failed", **available}
+    return {"status": "ready", **available}
+
 @app.get("/")
 def read_root():
     return {"message": "AI Commercial Real Estate Analyst Backend is running."}
 
-@app.post("/analyze")
-async def analyze_document(request: AnalysisRequest):
-    """
-    Accepts commercial real estate data, enriches it with data from BigQuery,
-    analyzes it using Gemini via LangChain, and returns a comprehensive deal memo.
-    """
+def _check_server_configuration() -> None:
     if not os.getenv("API_KEY") or not os.getenv("GCP_PROJECT_ID"):
         raise HTTPException(
             status_code=500, 
             detail="API_KEY or GCP_PROJECT_ID not configured on the server. Please create and configure the .env file."
         )
+
+def _validate_analysis_request(request: AnalysisRequest) -> None:
+    """Rejects requests the server cannot analyze before any work is done."""
+    _check_server_configuration()
         
     if not request.file_content or not request.file_content.strip():
         raise HTTPException(status_code=400, detail="File content is empty.")
 
+def _analysis_http_error(e: Exception) -> HTTPException:
+    """
+    Maps an analysis failure to an HTTP error. Open circuits and quota errors that
+    outlasted the retries are 503s the client can retry later; anything else is a 500.
+    """
+    print(f"An error occurred during analysis: {e}")
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+    if is_retryable(e):
+        return HTTPException(
+            status_code=503,
+            detail=f"The analysis service is over capacity, please retry shortly: {str(e)}",
+            headers={"Retry-After": "10"},
+        )
+    return HTTPException(status_code=500, detail=f"An internal error occurred during analysis: {str(e)}")
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Formats one Server-Sent Event; the payload is JSON so newlines in the memo survive."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def get_job_queue(request: Request) -> JobQueue:
+    """Returns the job queue started by the lifespan handler."""
+    job_queue = getattr(request.app.state, "job_queue", None)
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="The analysis job queue is not running.")
+    return job_queue
+
+@app.post("/analyze")
+async def analyze_document(
+    request: AnalysisRequest,
+    response: Response,
+    http_request: Request,
+    mode: str = Query("sync", pattern="^(sync|job)$"),
+    priority: int = Query(0, ge=MIN_PRIORITY, le=MAX_PRIORITY),
+):
+    """
+    Accepts commercial real estate data, enriches it with data from BigQuery,
+    analyzes it using Gemini via LangChain, and returns a comprehensive deal memo.
+
+    With `?mode=job` the analysis is queued instead and a job id is returned
+    immediately (202); poll GET /jobs/{job_id} for the memo. Jobs with a higher
+    `priority` (0-9) run first, and 429 is returned while the queue is full.
+    """
+    _validate_analysis_request(request)
+
+    if mode == "job":
+        job_queue = get_job_queue(http_request)
+        try:
+            job = await job_queue.submit(request.file_content, priority=priority)
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+        response.status_code = 202
+        return {"job_id": job.id, "status": job.status}
+
+    # Only the synchronous path waits for the clients; jobs are accepted during warm-up.
+    clients = await get_service_clients(http_request)
+    try:
+        memo = await get_analysis_memo(
+            request.file_content,
+            enrichment_client=clients.enrichment_client,
+            chain=clients.analysis_chain,
+        )
+        return {"memo": memo}
+    except Exception as e:
+        raise _analysis_http_error(e)
+
+def _memo_event_stream(file_content: str, clients: ServiceClients) -> StreamingResponse:
+    """Wraps `stream_analysis_memo` in a Server-Sent Events response."""
+    async def events():
+        try:
+            async for chunk in stream_analysis_memo(
+                file_content,
+                enrichment_client=clients.enrichment_client,
+                chain=clients.analysis_chain,
+            ):
+                yield _sse_event({"delta": chunk})
+            yield _sse_event({}, event="done")
+        except Exception as e:
+            print(f"An error occurred during streaming analysis: {e}")
+            yield _sse_event({"detail": f"An internal error occurred during analysis: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/analyze/stream")
+async def analyze_document_stream(request: AnalysisRequest, clients: ServiceClients = Depends(get_service_clients)):
+    """
+    Streams the deal memo as Server-Sent Events while Gemini generates it.
+    Each `data:` event carries {"delta": "..."}; the stream ends with a `done`
+    event, or an `error` event with {"detail": "..."} if the analysis fails.
+    """
+    _validate_analysis_request(request)
+    return _memo_event_stream(request.file_content, clients)
+
+@app.post("/analyze/upload")
+async def analyze_upload(
+    file: UploadFile = File(...),
+    stream: bool = False,
+    clients: ServiceClients = Depends(get_service_clients),
+):
+    """
+    Accepts a multipart upload (.txt, .md, .csv rent roll or .pdf) instead of a JSON
+    string. The upload is spooled to disk by the server and converted to text
+    incrementally, then analyzed like /analyze. With `?stream=true` the memo is
+    streamed as Server-Sent Events like /analyze/stream.
+    """
+    _check_server_configuration()
+
+    try:
+        file_content = await extract_text_from_upload(file)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    finally:
+        await file.close()
+
+    if not file_content.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the uploaded file.")
+
+    if stream:
+        return _memo_event_stream(file_content, clients)
+
     try:
-        memo = await get_analysis_memo(request.file_content)
+        memo = await get_analysis_memo(
+            file_content,
+            enrichment_client=clients.enrichment_client,
+            chain=clients.analysis_chain,
+        )
         return {"memo": memo}
     except Exception as e:
-        print(f"An error occurred during analysis: {e}")
-        raise HTTPException(status_code=500, detail=f"An internal error occurred during analysis: {str(e)}")
+        raise _analysis_http_error(e)
+
+@app.post("/analyze/batch", status_code=202)
+async def analyze_batch(request: BatchAnalysisRequest, clients: ServiceClients = Depends(get_service_clients)):
+    """
+    Starts a batch analysis of many documents and returns a job id immediately.
+    BigQuery lookups are shared across the batch and Gemini calls run with bounded
+    concurrency. Poll GET /analyze/batch/{job_id} for per-document results. While
+    MAX_RUNNING_BATCHES batches are running, 429 is returned.
+    """
+    _check_server_configuration()
+
+    if not request.documents:
+        raise HTTPException(status_code=400, detail="No documents provided.")
+    if len(request.documents) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {MAX_BATCH_DOCUMENTS} documents.")
+    empty = [str(doc.id or index) for index, doc in enumerate(request.documents) if not doc.file_content.strip()]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"File content is empty for documents: {', '.join(empty)}")
+
+    try:
+        job = batch_jobs.create([doc.id or str(index) for index, doc in enumerate(request.documents)])
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+
+    async def run_job():
+        job.status = "running"
+        try:
+            await get_batch_analysis_memos(
+                [doc.file_content for doc in request.documents],
+                enrichment_client=clients.enrichment_client,
+                chain=clients.analysis_chain,
+                on_result=job.record_result,
+            )
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "failed"
+            raise
+        except Exception as e:
+            print(f"An error occurred during batch analysis {job.id}: {e}")
+            for index, result in enumerate(job.results):
+                if result is None:
+                    job.record_result(index, {"error": f"An internal error occurred during analysis: {str(e)}"})
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    job.task = asyncio.create_task(run_job())
+    return {"job_id": job.id, "status": job.status, "total": len(job.item_ids)}
+
+@app.get("/analyze/batch/{job_id}")
+def get_batch_job(job_id: str):
+    """Returns the status of a batch analysis and the results finished so far."""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found.")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Returns the status of a queued analysis, and its memo or error once finished."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@app.get("/jobs")
+def job_queue_stats(job_queue: JobQueue = Depends(get_job_queue)):
+    """Returns the queue depth, busy workers and the number of jobs rejected because the queue was full."""
+    return job_queue.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Returns hit/miss counters for the BigQuery enrichment cache and the memo cache, and the comps index size."""
+    return {"enrichment": get_enrichment_cache_stats(), "memo": get_memo_cache_stats(), "comps_index": get_comps_index_stats()}
+
+@app.get("/governor/stats")
+def governor_stats():
+    """Returns queue depth, throttle and retry counts and circuit state for Gemini and BigQuery calls."""
+    return get_governor_stats()
+
+@app.post("/cache/invalidate")
+def cache_invalidate(table: Optional[str] = None):
+    """
+    Drops cached BigQuery enrichment results. Call this after the source tables are
+    refreshed; pass `table` (a key of BIGQUERY_TABLES) to only drop that table's entries.
+    """
+    try:
+        removed = invalidate_enrichment_cache(table)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"invalidated": removed}
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: per-stage and end-to-end analysis latency histograms, Gemini
+    token counts and BigQuery bytes processed.
+    """
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
 
 # To run this app:
 # 1. Navigate to the 'backend' directory.
@@ -1,16 +1,30 @@
 
+import asyncio
+import concurrent.futures
+import contextvars
+import datetime
+import hashlib
+import json
+import math
 import os
 import re
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from google.cloud import bigquery
-from google.api_core.exceptions import GoogleAPICallError
-import pandas as pd
+import time
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, List, NamedTuple, Optional, Tuple
 
 from prompts import LOAN_ANALYSIS_PROMPT_TEMPLATE
+from services.cache import MISSING, DiskCache, SingleFlight, TieredCache, TTLCache
+from services.clients import GEMINI_MODEL, build_analysis_chain, create_enrichment_client
+from services.comps_index import COMPS_COLUMNS, ComparablesIndex, query_targets, read_comps_rows
+from services.context_budget import budget_prompt_inputs
+from services.governor import BIGQUERY_GOVERNOR, BIGQUERY_MAX_CONCURRENCY, GEMINI_GOVERNOR
+from services.lazy_imports import lazy_importer
+from services.metrics import record_bigquery_bytes, request_trace, stage, token_usage_callback
+from services.snapshot import SnapshotEngine
+
+_load = lazy_importer(globals(), {"bigquery": ("google.cloud.bigquery", None)})
+__getattr__ = _load
 
-GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 BIGQUERY_TABLES = {
     "commercial_real_estate": "ccibt-hack25ww7-719.Genavate_real_estae_data.commercial_real_estate",
     "realtor_data": "ccibt-hack25ww7-719.Genavate_real_estae_data.realtor_data",
@@ -19,125 +33,622 @@ BIGQUERY_TABLES = {
     "safmrs_revised": "ccibt-hack25ww7-719.Genavate_real_estae_data.safmrs_revised",
     "fy2026_safmrs": "ccibt-hack25ww7-719.Genavate_real_estae_data.fy2026_safmrs",
 }
+# Per-query limit for the enrichment lookups; slower queries are reported as unavailable.
+BIGQUERY_QUERY_TIMEOUT_SECONDS = float(os.getenv("BIGQUERY_QUERY_TIMEOUT_SECONDS", "15"))
+# Enrichment queries block a thread each, so they get their own pool, sized to the
+# BigQuery concurrency limit, instead of sharing the small default executor.
+BIGQUERY_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=BIGQUERY_MAX_CONCURRENCY, thread_name_prefix="bigquery"
+)
+_TIMEOUT_ERRORS = (asyncio.TimeoutError, concurrent.futures.TimeoutError)
+
+# Enrichment results only depend on the query parameters, so they are cached across
+# requests. Set ENRICHMENT_CACHE_DIR to also keep them on disk across restarts.
+ENRICHMENT_CACHE_TTL_SECONDS = float(os.getenv("ENRICHMENT_CACHE_TTL_SECONDS", "3600"))
+ENRICHMENT_CACHE_MAX_ENTRIES = int(os.getenv("ENRICHMENT_CACHE_MAX_ENTRIES", "2048"))
+ENRICHMENT_CACHE_DIR = os.getenv("ENRICHMENT_CACHE_DIR")
+ENRICHMENT_CACHE_DISK_MAX_ENTRIES = int(os.getenv("ENRICHMENT_CACHE_DISK_MAX_ENTRIES", "20000"))
+ENRICHMENT_CACHE = TieredCache(
+    TTLCache(max_entries=ENRICHMENT_CACHE_MAX_ENTRIES, ttl=ENRICHMENT_CACHE_TTL_SECONDS),
+    DiskCache(
+        ENRICHMENT_CACHE_DIR, ttl=ENRICHMENT_CACHE_TTL_SECONDS, max_entries=ENRICHMENT_CACHE_DISK_MAX_ENTRIES
+    ) if ENRICHMENT_CACHE_DIR else None,
+)
+# Finished memos are cached by document, prompt version and enrichment context, so
+# resubmitting the same document returns the stored memo without calling Gemini.
+MEMO_CACHE_TTL_SECONDS = float(os.getenv("MEMO_CACHE_TTL_SECONDS", "86400"))
+MEMO_CACHE_MAX_ENTRIES = int(os.getenv("MEMO_CACHE_MAX_ENTRIES", "256"))
+MEMO_CACHE = TTLCache(max_entries=MEMO_CACHE_MAX_ENTRIES, ttl=MEMO_CACHE_TTL_SECONDS)
+# Identical memo requests in flight at the same time share one Gemini call.
+MEMO_FLIGHTS = SingleFlight()
+PROMPT_VERSION = hashlib.sha256(f"{GEMINI_MODEL}\n{LOAN_ANALYSIS_PROMPT_TEMPLATE}".encode("utf-8")).hexdigest()[:16]
+# Nearest-neighbour comps are answered from this in-memory index once it is loaded.
+# A positive COMPS_INDEX_REFRESH_SECONDS loads it at startup and rebuilds it on that interval.
+COMPS_INDEX = ComparablesIndex()
+COMPS_INDEX_REFRESH_SECONDS = float(os.getenv("COMPS_INDEX_REFRESH_SECONDS", "0"))
+# Maximum number of Gemini calls in flight for one batch analysis.
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+# Width of the geometric square-footage bands used for comps, so similar sizes share a cache entry.
+SQFT_BAND_RATIO = 1.1
+
+_STATE_CODES = "AL|AK|AZ|AR|CA|CO|CT|DE|FL|GA|HI|ID|IL|IN|IA|KS|KY|LA|ME|MD|MA|MI|MN|MS|MO|MT|NE|NV|NH|NJ|NM|NY|NC|ND|OH|OK|OR|PA|RI|SC|SD|TN|TX|UT|VT|VA|WA|WV|WI|WY"
+
+# Every detail is found in a single left-to-right scan. All alternatives start at a
+# word boundary, so the scan rejects positions inside words with a single check.
+# State codes must be upper case so words like "in" or "or" are not read as states,
+# except in a full "City, st 12345" address, where the ZIP makes a lower-case code
+# unambiguous. City names are at most four capitalized words directly before
+# ", ST", which keeps backtracking bounded.
+_PROPERTY_DETAILS_PATTERN = re.compile(rf"""
+    \b(?:
+        (?P<address>(?P<city>[A-Z][A-Za-z.'-]*(?:[ ][A-Z][A-Za-z.'-]*){{0,3}}),[ \t]*
+            (?:(?P<address_state>{_STATE_CODES})\b(?:[ \t]+(?P<address_zip>\d{{5}})(?:-\d{{4}})?\b)?
+              | (?P<address_state_any_case>(?i:{_STATE_CODES}))[ \t]+(?P<address_zip_any_case>\d{{5}})(?:-\d{{4}})?\b))
+      | (?P<state_zip>(?P<state_zip_state>{_STATE_CODES})[ \t]+(?P<state_zip_zip>\d{{5}})(?:-\d{{4}})?\b)
+      | (?<![\d,])(?P<sqft>\d{{1,3}}(?:,\d{{3}})+|\d+)[ \t]*(?i:sqft|sf|sq\.?[ ]?ft\.?)(?![A-Za-z])
+      | (?P<zip>\d{{5}}\b)
+      | (?P<state>(?:{_STATE_CODES})\b)
+      | (?P<property_type>(?i:office|retail|industrial|multifamily|land))(?i:s)?\b
+    )
+""", re.VERBOSE)
+
+
+def _scan_property_text(file_content: str) -> Tuple[List[dict], dict]:
+    """
+    Scans the text once and returns the ranked address candidates plus the first
+    ZIP code, square footage and property type mentioned anywhere.
+
+    Candidates are ranked by completeness (city, state and ZIP > city and state >
+    state and ZIP > bare state), then by how often their state is mentioned, then by
+    position.
+    """
+    candidates = []
+    state_counts = {}
+    first = {"zip": None, "sqft": None, "property_type": None}
+    for match in _PROPERTY_DETAILS_PATTERN.finditer(file_content):
+        kind = match.lastgroup
+        if kind == "address":
+            candidate = {
+                "city": match.group("city").title(),
+                "state": (match.group("address_state") or match.group("address_state_any_case")).upper(),
+                "zip": match.group("address_zip") or match.group("address_zip_any_case"),
+            }
+        elif kind == "state_zip":
+            candidate = {"city": None, "state": match.group("state_zip_state"), "zip": match.group("state_zip_zip")}
+        elif kind == "state":
+            candidate = {"city": None, "state": match.group("state"), "zip": None}
+        else:
+            if first[kind] is None:
+                first[kind] = match.group(kind)
+            continue
+        candidate["position"] = match.start()
+        candidate["score"] = (2 if candidate["city"] else 0) + (1 if candidate["zip"] else 0)
+        candidates.append(candidate)
+        state_counts[candidate["state"]] = state_counts.get(candidate["state"], 0) + 1
+
+    candidates.sort(key=lambda c: (-c["score"], -state_counts[c["state"]], c["position"]))
+    if first["sqft"] is not None:
+        first["sqft"] = int(first["sqft"].replace(",", ""))
+    if first["property_type"] is not None:
+        first["property_type"] = first["property_type"].lower()
+    return candidates, first
+
+
+def _extract_property_candidates(file_content: str) -> List[dict]:
+    """Returns every address-like mention in the text, best first (see `_scan_property_text`)."""
+    return _scan_property_text(file_content)[0]
+
 
 def _extract_property_details(file_content: str) -> dict:
     """Extracts location and property details from text content."""
-    details = {"state": None, "city": None, "zip": None, "property_type": None, "sqft": None}
-    
-    # Simple extraction logic using regex
-    details['zip'] = (re.search(r'\b\d{5}\b', file_content) or {}).get(0)
-    state_match = re.search(r'\b(AL|AK|AZ|AR|CA|CO|CT|DE|FL|GA|HI|ID|IL|IN|IA|KS|KY|LA|ME|MD|MA|MI|MN|MS|MO|MT|NE|NV|NH|NJ|NM|NY|NC|ND|OH|OK|OR|PA|RI|SC|SD|TN|TX|UT|VT|VA|WA|WV|WI|WY)\b', file_content, re.IGNORECASE)
-    if state_match:
-        details['state'] = state_match.group(0).upper()
-        city_match = re.search(r'([A-Za-z\s]+)(?:,\s*|\s+)' + re.escape(details['state']), file_content, re.IGNORECASE)
-        if city_match:
-            details['city'] = city_match.group(1).strip().title()
-
-    prop_type_match = re.search(r'(office|retail|industrial|multifamily|land)', file_content, re.IGNORECASE)
-    if prop_type_match:
-        details['property_type'] = prop_type_match.group(0).lower()
-
-    sqft_match = re.search(r'(\d{1,3}(?:,\d{3})*|\d+)\s*(?:sqft|sf|sq\.? ft\.?)', file_content, re.IGNORECASE)
-    if sqft_match:
-        details['sqft'] = int(sqft_match.group(1).replace(',', ''))
-        
+    candidates, first = _scan_property_text(file_content)
+    details = {"state": None, "city": None, "zip": None, "property_type": first["property_type"], "sqft": first["sqft"]}
+    if candidates:
+        best = candidates[0]
+        details["state"] = best["state"]
+        details["city"] = best["city"]
+        details["zip"] = best["zip"]
+    if details["zip"] is None:
+        details["zip"] = first["zip"]
     return details
 
-def _fetch_bigquery_context(details: dict) -> str:
-    """Fetches relevant data from BigQuery based on extracted property details."""
-    if not details.get("state"):
-        return "No location information could be extracted to query BigQuery."
 
-    context_parts = []
-    try:
-        client = bigquery.Client(project=GCP_PROJECT_ID)
-        state = details["state"]
-        city = details.get("city")
-        prop_type = details.get("property_type")
-        sqft = details.get("sqft")
-
-        params = [bigquery.ScalarQueryParameter("state", "STRING", state)]
-        
-        # --- More Intelligent Queries ---
-        
-        # Query 1: Realtor Data - Find comps with similar size and type
-        realtor_query = f"SELECT city, state, price, beds, baths, sqft FROM `{BIGQUERY_TABLES['realtor_data']}` WHERE state = @state"
-        if city:
-            realtor_query += " AND city = @city"
-            params.append(bigquery.ScalarQueryParameter("city", "STRING", city))
-        if sqft:
-            realtor_query += " AND sqft BETWEEN @sqft_min AND @sqft_max"
-            params.append(bigquery.ScalarQueryParameter("sqft_min", "INT64", int(sqft * 0.8)))
-            params.append(bigquery.ScalarQueryParameter("sqft_max", "INT64", int(sqft * 1.2)))
-        realtor_query += " LIMIT 5"
-        
-        job_config = bigquery.QueryJobConfig(query_parameters=params)
-        results = client.query(realtor_query, job_config=job_config).to_dataframe()
-        if not results.empty:
-            context_parts.append(f"Realtor Market Data:\n{results.to_json(orient='records')}")
-
-        # Query 2: Commercial Real Estate Data - Find comps with similar type
-        comm_query = f"SELECT sale_price, city, state, property_type, year_built FROM `{BIGQUERY_TABLES['commercial_real_estate']}` WHERE state = @state"
-        comm_params = [bigquery.ScalarQueryParameter("state", "STRING", state)]
-        if prop_type:
-            comm_query += " AND LOWER(property_type) = @prop_type"
-            comm_params.append(bigquery.ScalarQueryParameter("prop_type", "STRING", prop_type))
-        comm_query += " LIMIT 5"
-        
-        job_config = bigquery.QueryJobConfig(query_parameters=comm_params)
-        results = client.query(comm_query, job_config=job_config).to_dataframe()
-        if not results.empty:
-            context_parts.append(f"Commercial Real Estate Comps:\n{results.to_json(orient='records')}")
+class EnrichmentQuery(NamedTuple):
+    """
+    A single lookup used to enrich the deal memo, described structurally so it can be
+    run as parameterized BigQuery SQL or against a local snapshot.
+
+    `filters` are (column, op, value) tuples where op is "=", "lower=" (case-insensitive
+    equality) or "between" (value is an inclusive (low, high) pair).
+
+    `target_sqft` is the subject's exact square footage for comps lookups answered
+    by COMPS_INDEX. It is not part of the cache key: the sqft filter uses the
+    banded size so similar properties share a cache entry.
+    """
+    label: str
+    table: str
+    columns: Tuple[str, ...]
+    filters: Tuple[Tuple[str, str, Any], ...]
+    limit: int
+    order_by_desc: Optional[str] = None
+    optional: bool = False
+    target_sqft: Optional[float] = None
+
+    @property
+    def cache_key(self) -> str:
+        """Cache key made of the source table and the query parameters."""
+        return f"{self.table}:" + json.dumps([self.filters, self.order_by_desc, self.limit])
+
+    def to_sql(self) -> Tuple[str, list]:
+        """Renders the query as BigQuery SQL and its query parameters."""
+        bigquery = _load("bigquery")
+        conditions = []
+        params = []
+        for column, op, value in self.filters:
+            if op == "=":
+                conditions.append(f"{column} = @{column}")
+                params.append(bigquery.ScalarQueryParameter(column, "STRING", value))
+            elif op == "lower=":
+                conditions.append(f"LOWER({column}) = @{column}")
+                params.append(bigquery.ScalarQueryParameter(column, "STRING", value))
+            elif op == "between":
+                conditions.append(f"{column} BETWEEN @{column}_min AND @{column}_max")
+                params.append(bigquery.ScalarQueryParameter(f"{column}_min", "INT64", value[0]))
+                params.append(bigquery.ScalarQueryParameter(f"{column}_max", "INT64", value[1]))
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+
+        sql = f"SELECT {', '.join(self.columns)} FROM `{BIGQUERY_TABLES[self.table]}`"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if self.order_by_desc:
+            sql += f" ORDER BY {self.order_by_desc} DESC"
+        sql += f" LIMIT {self.limit}"
+        return sql, params
+
 
+def _sqft_band(sqft: int) -> int:
+    """Snaps a square footage to the centre of its geometric band."""
+    return int(round(SQFT_BAND_RATIO ** round(math.log(sqft, SQFT_BAND_RATIO))))
+
+
+def _build_enrichment_queries(details: dict) -> List[EnrichmentQuery]:
+    """Builds the market and risk queries for the extracted property details."""
+    state_filter = ("state", "=", details["state"])
+    city = details.get("city")
+    prop_type = details.get("property_type")
+    sqft = _sqft_band(details["sqft"]) if details.get("sqft") else None
+
+    # Query 1: Realtor Data - Find comps with similar size and type
+    realtor_filters = [state_filter]
+    if city:
+        realtor_filters.append(("city", "=", city))
+    if sqft:
+        realtor_filters.append(("sqft", "between", (int(sqft * 0.8), int(sqft * 1.2))))
+
+    # Query 2: Commercial Real Estate Data - Find comps with similar type
+    comm_filters = [state_filter]
+    if prop_type:
+        comm_filters.append(("property_type", "lower=", prop_type))
+
+    return [
+        EnrichmentQuery(
+            "Realtor Market Data", "realtor_data",
+            ("city", "state", "price", "beds", "baths", "sqft"), tuple(realtor_filters), limit=5,
+            target_sqft=details.get("sqft"),
+        ),
+        EnrichmentQuery(
+            "Commercial Real Estate Comps", "commercial_real_estate",
+            ("sale_price", "city", "state", "property_type", "year_built"), tuple(comm_filters), limit=5,
+        ),
         # Query 3: NFIP Financial Losses by State
-        nfip_query = f"SELECT state, amount_paid_on_claims FROM `{BIGQUERY_TABLES['nfip_losses_by_state']}` WHERE state = @state LIMIT 1"
-        job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("state", "STRING", state)])
-        results = client.query(nfip_query, job_config=job_config).to_dataframe()
-        if not results.empty:
-            context_parts.append(f"NFIP Financial Losses Data:\n{results.to_json(orient='records')}")
-
-        # Query 4: SAFMRS Revised Risk Data
-        safmrs_query = f"SELECT state, risk_summary, last_updated FROM `{BIGQUERY_TABLES['safmrs_revised']}` WHERE state = @state ORDER BY last_updated DESC LIMIT 1"
-        job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("state", "STRING", state)])
+        EnrichmentQuery(
+            "NFIP Financial Losses Data", "nfip_losses_by_state",
+            ("state", "amount_paid_on_claims"), (state_filter,), limit=1,
+        ),
+        # Query 4: SAFMRS Revised Risk Data (the table may not exist or its schema may differ)
+        EnrichmentQuery(
+            "Internal SAFMRS Risk Data", "safmrs_revised",
+            ("state", "risk_summary", "last_updated"), (state_filter,), limit=1,
+            order_by_desc="last_updated", optional=True,
+        ),
+    ]
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _serialize_rows(rows) -> Optional[str]:
+    """
+    Serializes result rows (BigQuery Rows or dicts) as a JSON array of records, or
+    returns None if there are none. The enrichment queries return at most a few
+    rows, so this avoids building a DataFrame for each of them.
+    """
+    records = [dict(row.items()) for row in rows]
+    return json.dumps(records, default=_json_default) if records else None
+
+
+def _run_enrichment_query(client, query: EnrichmentQuery, timeout: float) -> Optional[str]:
+    """
+    Runs one enrichment query (blocking) and returns its rows as JSON, or None if
+    empty. The timeout starts when the query starts, not while it waits for a thread.
+    """
+    if isinstance(client, SnapshotEngine):
+        with stage(f"snapshot.{query.table}"):
+            rows = client.run_query(query)
+        return _serialize_rows(rows)
+
+    sql, params = query.to_sql()
+    job_config = _load("bigquery").QueryJobConfig(query_parameters=params)
+    # Let BigQuery cancel the job server-side once the caller has stopped waiting for it.
+    job_config.job_timeout_ms = int(timeout * 1000)
+    deadline = time.monotonic() + timeout
+    with stage(f"bigquery.{query.table}"):
+        job = client.query(sql, job_config=job_config, timeout=timeout)
+        rows = job.result(timeout=max(deadline - time.monotonic(), 0))
+    record_bigquery_bytes(query.table, job.total_bytes_processed)
+    with stage(f"serialize.{query.table}"):
+        return _serialize_rows(rows)
+
+
+def _refresh_snapshot(client) -> None:
+    """Picks up a re-exported snapshot, dropping enrichment results cached from the old one."""
+    if isinstance(client, SnapshotEngine) and client.refresh():
+        print(f"Snapshot at {client.directory} was re-exported; reloading it")
+        invalidate_enrichment_cache()
+
+
+async def _run_enrichment_queries(queries: List[EnrichmentQuery], client, timeout: float) -> dict:
+    """
+    Runs each distinct query once, concurrently, on BIGQUERY_EXECUTOR and returns a
+    mapping of each query to its result (or the exception raised). Comps queries
+    are answered from COMPS_INDEX when it is loaded; other results are served from
+    and stored in ENRICHMENT_CACHE.
+    """
+    _refresh_snapshot(client)
+    indexed_tables = {query.table for query in queries if COMPS_INDEX.is_loaded(query.table)}
+
+    def lookup_key(query: EnrichmentQuery):
+        # Indexed comps depend on the subject's exact size, not just its band.
+        if query.table in indexed_tables:
+            return query.cache_key, query.target_sqft
+        return query.cache_key
+
+    unique = {}
+    for query in queries:
+        unique.setdefault(lookup_key(query), query)
+
+    uncached_keys = [key for key, query in unique.items() if query.table not in indexed_tables]
+    cached = dict(zip(uncached_keys, await asyncio.gather(*(ENRICHMENT_CACHE.aget(key) for key in uncached_keys))))
+    if client is None and any(value is MISSING for value in cached.values()):
+        client = await asyncio.to_thread(create_enrichment_client)
+
+    async def run(key, query: EnrichmentQuery) -> Optional[str]:
+        if query.table in indexed_tables:
+            with stage(f"comps_index.{query.table}"):
+                return _serialize_rows(COMPS_INDEX.nearest(query.table, **query_targets(query)))
+        if cached[key] is not MISSING:
+            return cached[key]
+        def attempt():
+            # Copy the context so the worker's stages land in this request's trace.
+            context = contextvars.copy_context()
+            return asyncio.get_running_loop().run_in_executor(
+                BIGQUERY_EXECUTOR, context.run, _run_enrichment_query, client, query, timeout
+            )
+
+        if isinstance(client, SnapshotEngine):
+            value = await attempt()
+        else:
+            value = await BIGQUERY_GOVERNOR.call(attempt)
+        await ENRICHMENT_CACHE.aset(query.cache_key, value)
+        return value
+
+    outcomes = await asyncio.gather(*(run(key, query) for key, query in unique.items()), return_exceptions=True)
+    results = dict(zip(unique, outcomes))
+    return {query: results[lookup_key(query)] for query in queries}
+
+
+def _render_bigquery_context(queries: List[EnrichmentQuery], outcomes: dict, timeout: float) -> str:
+    """Formats the results of one document's enrichment queries for the prompt."""
+    from google.api_core.exceptions import GoogleAPICallError
+
+    context_parts = []
+    unavailable = []
+    api_errors = []
+    for query in queries:
+        outcome = outcomes[query]
+        if isinstance(outcome, _TIMEOUT_ERRORS):
+            print(f"BigQuery query for {query.label} timed out after {timeout}s")
+            unavailable.append(f"{query.label} (timed out)")
+        elif isinstance(outcome, Exception) and query.optional:
+            print(f"Could not query {query.label}, table may not exist or schema differs: {outcome}")
+        elif isinstance(outcome, GoogleAPICallError):
+            print(f"BigQuery API Error for {query.label}: {outcome}")
+            api_errors.append(outcome)
+            unavailable.append(f"{query.label} (query failed)")
+        elif isinstance(outcome, Exception):
+            print(f"An unexpected error occurred during BigQuery fetch for {query.label}: {outcome}")
+            unavailable.append(f"{query.label} (query failed)")
+        elif outcome is not None:
+            context_parts.append(f"{query.label}:\n{outcome}")
+
+    if not context_parts:
+        if api_errors:
+            return f"Error accessing BigQuery. Please check GCP project permissions and table names. Details: {api_errors[0].message}"
+        if unavailable:
+            return "An unexpected error occurred while fetching data from BigQuery."
+        return "No relevant data found in BigQuery for the specified location."
+
+    if unavailable:
+        context_parts.append("Unavailable BigQuery Sources:\n" + ", ".join(unavailable))
+
+    return "\n\n".join(context_parts)
+
+
+async def _fetch_bigquery_contexts_async(details_list: List[dict], client=None, timeout: Optional[float] = None) -> List[str]:
+    """
+    Fetches the BigQuery context for several documents at once. Lookups shared by
+    several documents (e.g. the state-level NFIP and SAFMRS queries for documents
+    in the same state, or comps for the same city and size band) run only once.
+    """
+    timeout = BIGQUERY_QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+    queries_per_document = [
+        _build_enrichment_queries(details) if details.get("state") else None
+        for details in details_list
+    ]
+    all_queries = [query for queries in queries_per_document if queries for query in queries]
+
+    outcomes = {}
+    if all_queries:
         try:
-            results = client.query(safmrs_query, job_config=job_config).to_dataframe()
-            if not results.empty:
-                context_parts.append(f"Internal SAFMRS Risk Data:\n{results.to_json(orient='records')}")
-        except GoogleAPICallError as e:
-            print(f"Could not query SAFMRS table, may not exist or schema differs: {e.message}")
+            with stage("enrichment"):
+                outcomes = await _run_enrichment_queries(all_queries, client, timeout)
+        except Exception as e:
+            print(f"An unexpected error occurred during BigQuery fetch: {e}")
+            outcomes = None
+
+    contexts = []
+    for queries in queries_per_document:
+        if queries is None:
+            contexts.append("No location information could be extracted to query BigQuery.")
+        elif outcomes is None:
+            contexts.append("An unexpected error occurred while fetching data from BigQuery.")
+        else:
+            contexts.append(_render_bigquery_context(queries, outcomes, timeout))
+    return contexts
 
-        if not context_parts:
-            return "No relevant data found in BigQuery for the specified location."
 
-        return "\n\n".join(context_parts)
+async def _fetch_bigquery_context_async(details: dict, client=None, timeout: Optional[float] = None) -> str:
+    """
+    Fetches relevant data from BigQuery based on extracted property details.
+
+    The enrichment queries run concurrently in worker threads so the event loop is
+    never blocked. Each query has its own timeout; queries that fail or time out are
+    reported as unavailable and the remaining results are still returned.
+    Successful results are served from ENRICHMENT_CACHE when available.
+    """
+    return (await _fetch_bigquery_contexts_async([details], client=client, timeout=timeout))[0]
+
 
-    except GoogleAPICallError as e:
-        print(f"BigQuery API Error: {e}")
-        return f"Error accessing BigQuery. Please check GCP project permissions and table names. Details: {e.message}"
-    except Exception as e:
-        print(f"An unexpected error occurred during BigQuery fetch: {e}")
-        return "An unexpected error occurred while fetching data from BigQuery."
+def _fetch_bigquery_context(details: dict, client=None) -> str:
+    """Synchronous wrapper around `_fetch_bigquery_context_async` for scripts and tests."""
+    return asyncio.run(_fetch_bigquery_context_async(details, client=client))
 
 
-async def get_analysis_memo(file_content: str) -> str:
+def invalidate_enrichment_cache(table: Optional[str] = None) -> int:
     """
-    Uses LangChain and Google Gemini to analyze the provided text content,
-    enriched with data from Google BigQuery.
+    Drops cached enrichment results, e.g. after the source tables are refreshed.
+    `table` is a key of BIGQUERY_TABLES; all entries are dropped when it is None.
     """
-    details = _extract_property_details(file_content)
-    bigquery_context = _fetch_bigquery_context(details)
+    if table is not None and table not in BIGQUERY_TABLES:
+        raise ValueError(f"Unknown BigQuery table: {table}")
+    return ENRICHMENT_CACHE.invalidate(f"{table}:" if table else None)
 
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", google_api_key=os.getenv("API_KEY"))
 
-    prompt = PromptTemplate(
-        template=LOAN_ANALYSIS_PROMPT_TEMPLATE,
-        input_variables=["file_content", "bigquery_context"],
-    )
+def get_enrichment_cache_stats() -> dict:
+    """Returns hit/miss counters for each enrichment cache tier."""
+    return ENRICHMENT_CACHE.stats()
+
+
+async def refresh_comps_index(client=None) -> dict:
+    """
+    Rebuilds COMPS_INDEX from the comps tables (BigQuery or a snapshot) in a worker
+    thread. A table that fails to load keeps its previous index. Returns the index stats.
+    """
+    if client is None:
+        client = await asyncio.to_thread(create_enrichment_client)
+    _refresh_snapshot(client)
+    for table in COMPS_COLUMNS:
+        try:
+            count = await asyncio.to_thread(
+                lambda: COMPS_INDEX.replace(table, read_comps_rows(client, table, BIGQUERY_TABLES[table]))
+            )
+            print(f"Comparables index for {table} rebuilt with {count} rows")
+        except Exception as e:
+            print(f"Could not rebuild the comparables index for {table}: {e}")
+    return COMPS_INDEX.stats()
+
+
+def get_comps_index_stats() -> dict:
+    """Returns the rows, partitions and load time of each indexed comps table."""
+    return COMPS_INDEX.stats()
+
+
+def get_memo_cache_stats() -> dict:
+    """Returns hit/miss counters for the memo cache and in-flight coalescing."""
+    return {**MEMO_CACHE.stats(), **MEMO_FLIGHTS.stats()}
+
+
+def invalidate_memo_cache() -> int:
+    """Drops every cached memo, e.g. after changing the model or prompt outside this file."""
+    return MEMO_CACHE.invalidate()
+
+
+def _normalize_document(file_content: str) -> str:
+    """Normalizes line endings and surrounding whitespace so trivially different uploads match."""
+    lines = file_content.replace("\r\n", "\n").replace("\r", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def _memo_cache_key(inputs: dict) -> str:
+    """Hashes the normalized document, prompt version and enrichment context."""
+    digest = hashlib.sha256()
+    for part in (PROMPT_VERSION, _normalize_document(inputs["file_content"]), inputs["bigquery_context"]):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+async def _generate_memo(inputs: dict, chain=None) -> str:
+    """
+    Returns the memo for the prompt inputs from MEMO_CACHE, or generates it with
+    Gemini. Concurrent identical requests are coalesced into one Gemini call.
+    """
+    key = _memo_cache_key(inputs)
+    memo = MEMO_CACHE.get(key)
+    if memo is not MISSING:
+        return memo
 
-    chain = prompt | llm | StrOutputParser()
-    response = await chain.ainvoke({
+    async def generate() -> str:
+        llm_chain = chain if chain is not None else build_analysis_chain()
+        with stage("llm"):
+            response = await GEMINI_GOVERNOR.call(
+                lambda: llm_chain.ainvoke(inputs, config={"callbacks": [token_usage_callback()]})
+            )
+        MEMO_CACHE.set(key, response)
+        return response
+
+    return await MEMO_FLIGHTS.do(key, generate)
+
+
+async def _budget_analysis_inputs(inputs: dict, details: dict) -> dict:
+    """
+    Fits the prompt inputs to their token budgets and logs the tokens saved. The
+    budgeting is CPU-bound on large documents, so it runs in a worker thread.
+    """
+    terms = [details.get("city"), details.get("state"), details.get("zip")]
+    with stage("context_budget"):
+        budgeted, report = await asyncio.to_thread(budget_prompt_inputs, inputs, terms=terms)
+    print("Prompt budget: " + ", ".join(
+        f"{name} {r['original_tokens']} -> {r['final_tokens']} tokens (saved {r['saved_tokens']})"
+        for name, r in report.items()
+    ))
+    return budgeted
+
+
+async def _build_analysis_inputs(file_content: str, enrichment_client=None) -> dict:
+    """Extracts property details and fetches the BigQuery context for the prompt."""
+    # Extraction scans the whole document, so it runs off the event loop.
+    with stage("extraction"):
+        details = await asyncio.to_thread(_extract_property_details, file_content)
+    bigquery_context = await _fetch_bigquery_context_async(details, client=enrichment_client)
+    return await _budget_analysis_inputs({
         "file_content": file_content,
         "bigquery_context": bigquery_context
-    })
+    }, details)
+
+
+async def get_analysis_memo(file_content: str, enrichment_client=None, chain=None) -> str:
+    """
+    Uses LangChain and Google Gemini to analyze the provided text content,
+    enriched with data from Google BigQuery.
+
+    The shared enrichment client (BigQuery or snapshot) and Gemini chain created at
+    startup should be passed in; when they are missing, per-call instances are created.
+    Repeat submissions of the same document are answered from MEMO_CACHE.
+    """
+    with request_trace("analyze"):
+        inputs = await _build_analysis_inputs(file_content, enrichment_client)
+        return await _generate_memo(inputs, chain)
+
+
+async def stream_analysis_memo(file_content: str, enrichment_client=None, chain=None) -> AsyncIterator[str]:
+    """
+    Same as `get_analysis_memo`, but yields the memo in chunks as Gemini generates it,
+    so the first text is available as soon as enrichment finishes. A cached memo is
+    yielded in one chunk; a fully streamed memo is added to the cache.
+    """
+    with request_trace("analyze_stream"):
+        inputs = await _build_analysis_inputs(file_content, enrichment_client)
+
+        key = _memo_cache_key(inputs)
+        memo = MEMO_CACHE.get(key)
+        if memo is not MISSING:
+            yield memo
+            return
+
+        if chain is None:
+            chain = build_analysis_chain()
+
+        chunks = []
+        # A partly streamed memo cannot be retried, so the stream only takes a governed slot.
+        with stage("llm"):
+            async with GEMINI_GOVERNOR.slot():
+                async for chunk in chain.astream(inputs, config={"callbacks": [token_usage_callback()]}):
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+        MEMO_CACHE.set(key, "".join(chunks))
+
+
+async def get_batch_analysis_memos(
+    documents: List[str],
+    enrichment_client=None,
+    chain=None,
+    concurrency: int = BATCH_LLM_CONCURRENCY,
+    on_result: Optional[Callable[[int, dict], None]] = None,
+) -> List[dict]:
+    """
+    Analyzes many documents at once. Property details are extracted for every
+    document first, the BigQuery lookups are deduplicated across the batch, and
+    the Gemini calls then run with at most `concurrency` in flight.
+
+    Returns one {"memo": ...} or {"error": ...} dict per document, in order.
+    `on_result(index, result)` is called as each document finishes.
+    """
+    def extract(doc: str):
+        try:
+            return _extract_property_details(doc)
+        except Exception as e:
+            print(f"Could not extract property details from batch document: {e}")
+            return e
+
+    with request_trace("analyze_batch"):
+        with stage("extraction"):
+            extracted = await asyncio.to_thread(lambda: [extract(doc) for doc in documents])
+        fetched = iter(await _fetch_bigquery_contexts_async(
+            [details for details in extracted if not isinstance(details, Exception)],
+            client=enrichment_client,
+        ))
+        contexts = [None if isinstance(details, Exception) else next(fetched) for details in extracted]
+
+        if chain is None:
+            chain = build_analysis_chain()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def analyze(index: int, file_content: str, bigquery_context: Optional[str]) -> dict:
+            async with semaphore:
+                try:
+                    if bigquery_context is None:
+                        raise ValueError(f"Could not extract property details: {extracted[index]}")
+                    inputs = await _budget_analysis_inputs({
+                        "file_content": file_content,
+                        "bigquery_context": bigquery_context
+                    }, extracted[index])
+                    memo = await _generate_memo(inputs, chain)
+                    result = {"memo": memo}
+                except Exception as e:
+                    print(f"An error occurred while analyzing batch document {index}: {e}")
+                    result = {"error": str(e)}
+            if on_result is not None:
+                on_result(index, result)
+            return result
 
-    return response
+        return list(await asyncio.gather(*(
+            analyze(index, doc, context) for index, (doc, context) in enumerate(zip(documents, contexts))
+        )))
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from services.job_queue import QueueFullError
+
+# Finished batch jobs are kept for polling this long before they are discarded.
+BATCH_JOB_TTL_SECONDS = float(os.getenv("BATCH_JOB_TTL_SECONDS", "3600"))
+# Batches running at once; further batches are rejected until one finishes.
+MAX_RUNNING_BATCHES = int(os.getenv("MAX_RUNNING_BATCHES", "4"))
+
+
+@dataclass
+class BatchJob:
+    """Progress and per-document results of one batch analysis."""
+    id: str
+    item_ids: List[str]
+    results: List[Optional[dict]]
+    # The same status words as queued jobs: queued, running, completed, failed.
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def record_result(self, index: int, result: dict) -> None:
+        self.results[index] = result
+
+    def to_dict(self) -> dict:
+        items = []
+        for item_id, result in zip(self.item_ids, self.results):
+            if result is None:
+                items.append({"id": item_id, "status": "pending"})
+            elif "error" in result:
+                items.append({"id": item_id, "status": "failed", "error": result["error"]})
+            else:
+                items.append({"id": item_id, "status": "completed", "memo": result["memo"]})
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.item_ids),
+            "completed": sum(1 for item in items if item["status"] == "completed"),
+            "failed": sum(1 for item in items if item["status"] == "failed"),
+            "items": items,
+        }
+
+
+class BatchJobStore:
+    """
+    In-process registry of batch jobs for the polling endpoint. At most
+    `max_running` batches run at once; `create` raises QueueFullError beyond that.
+    """
+
+    def __init__(self, ttl: float = BATCH_JOB_TTL_SECONDS, max_running: int = MAX_RUNNING_BATCHES):
+        self.ttl = ttl
+        self.max_running = max_running
+        self._jobs: Dict[str, BatchJob] = {}
+        self.rejected = 0
+
+    def running(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.finished_at is None)
+
+    def create(self, item_ids: List[str]) -> BatchJob:
+        self._prune()
+        if self.running() >= self.max_running:
+            self.rejected += 1
+            raise QueueFullError(f"Too many batch analyses are running ({self.max_running}).")
+        job = BatchJob(id=uuid.uuid4().hex, item_ids=item_ids, results=[None] * len(item_ids))
+        self._jobs[job.id] = job
+        return job
+
+    async def cancel_all(self) -> None:
+        """Cancels the running batches, e.g. at shutdown."""
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Returned by the caches when a key is absent, so that None can be cached as a value.
+MISSING = object()
+
+
+class TTLCache:
+    """A thread-safe in-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, prefix: Optional[str] = None) -> int:
+        """Removes every entry, or only those whose key starts with `prefix`. Returns the count removed."""
+        with self._lock:
+            if prefix is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class DiskCache:
+    """
+    A JSON-file cache shared across processes and restarts. Values must be JSON
+    serializable. Expired entries are deleted when read, and once the directory
+    holds more than `max_entries` files, expired and then least recently written
+    entries are pruned.
+    """
+
+    def __init__(self, directory: str, ttl: float = 86400, max_entries: int = 10000):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._entries = len(self._files())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _files(self) -> list:
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        with self._lock:
+            self._entries -= 1
+        return True
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return default
+        if entry.get("key") != key:
+            with self._lock:
+                self.misses += 1
+            return default
+        if entry.get("expires_at", 0) <= time.time():
+            if self._remove(path):
+                with self._lock:
+                    self.expirations += 1
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+        return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            is_new = not os.path.exists(path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires_at": time.time() + self.ttl, "value": value}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            print(f"Could not write disk cache entry: {e}")
+            return
+        with self._lock:
+            if is_new:
+                self._entries += 1
+            over_limit = self._entries > self.max_entries
+        if over_limit:
+            self.prune()
+
+    def prune(self) -> int:
+        """
+        Deletes expired entries, then the least recently written ones until the cache
+        is back to 90% of `max_entries` (so pruning is not repeated on every write).
+        Returns the number of entries removed.
+        """
+        now = time.time()
+        files = []
+        for path in self._files():
+            try:
+                modified = os.stat(path).st_mtime
+            except OSError:
+                continue
+            files.append((modified, path))
+        files.sort()
+        with self._lock:
+            self._entries = len(files)
+
+        removed = 0
+        target = int(self.max_entries * 0.9)
+        for modified, path in files:
+            expired = modified + self.ttl <= now
+            if not expired and len(files) - removed <= target:
+                break
+            if self._remove(path):
+                removed += 1
+                with self._lock:
+                    if expired:
+                        self.expirations += 1
+                    else:
+                        self.evictions += 1
+        return removed
+
+    def invalidate(self, prefix: Optional[str] = None) -> int:
+        removed = 0
+        for path in self._files():
+            if prefix is not None:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        if not json.load(f).get("key", "").startswith(prefix):
+                            continue
+                except (OSError, ValueError):
+                    pass
+            if self._remove(path):
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._files()),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
+
+
+class TieredCache:
+    """An in-process TTLCache backed by an optional DiskCache. Disk hits are promoted to memory."""
+
+    def __init__(self, memory: TTLCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not MISSING:
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    async def aget(self, key: str, default: Any = MISSING) -> Any:
+        """Same as `get`, but reads the disk tier in a worker thread instead of on the event loop."""
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return value
+        if self.disk is None:
+            return default
+        value = await asyncio.to_thread(self.disk.get, key)
+        if value is MISSING:
+            return default
+        self.memory.set(key, value)
+        return value
+
+    async def aset(self, key: str, value: Any) -> None:
+        """Same as `set`, but writes the disk tier in a worker thread."""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def invalidate(self, prefix: Optional[str] = None) -> int:
+        removed = self.memory.invalidate(prefix)
+        if self.disk is not None:
+            removed += self.disk.invalidate(prefix)
+        return removed
+
+    def stats(self) -> dict:
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls with the same key: the first caller starts the
+    work and later callers await the same result. The work runs as its own task, so
+    it is not cancelled when the caller that started it goes away.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "started": self.started, "coalesced": self.coalesced}
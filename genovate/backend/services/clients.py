@@ -0,0 +1,117 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from prompts import LOAN_ANALYSIS_PROMPT_TEMPLATE
+from services.lazy_imports import lazy_importer
+from services.snapshot import SnapshotEngine
+
+# The Gemini and BigQuery client libraries take most of a second to import, so they
+# are loaded when the clients are first built rather than when the API starts.
+_load = lazy_importer(globals(), {
+    "bigquery": ("google.cloud.bigquery", None),
+    "ChatGoogleGenerativeAI": ("langchain_google_genai", "ChatGoogleGenerativeAI"),
+})
+__getattr__ = _load
+
+GEMINI_MODEL = "gemini-2.5-flash"
+# Size of the HTTP connection pool shared by all concurrent BigQuery queries.
+# requests defaults to 10, which is exhausted by a handful of concurrent /analyze calls.
+BIGQUERY_POOL_SIZE = int(os.getenv("BIGQUERY_POOL_SIZE", "32"))
+# "bigquery" queries the live tables; "snapshot" answers the same queries from local
+# Parquet exports in SNAPSHOT_DIR (see `python -m services.snapshot export`).
+ENRICHMENT_BACKEND = os.getenv("ENRICHMENT_BACKEND", "bigquery")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+
+@dataclass
+class ServiceClients:
+    """Long-lived clients shared by every request handled by this process."""
+    bigquery_client: Optional[Any] = None
+    snapshot_engine: Optional[SnapshotEngine] = None
+    analysis_chain: Optional[Any] = None
+
+    @property
+    def enrichment_client(self):
+        """The client that answers enrichment queries for the configured backend."""
+        return self.snapshot_engine if self.snapshot_engine is not None else self.bigquery_client
+
+
+def create_bigquery_client():
+    """Creates a BigQuery client with a connection pool sized for concurrent queries."""
+    from requests.adapters import HTTPAdapter
+
+    client = _load("bigquery").Client(project=os.getenv("GCP_PROJECT_ID"))
+    adapter = HTTPAdapter(pool_connections=BIGQUERY_POOL_SIZE, pool_maxsize=BIGQUERY_POOL_SIZE)
+    client._http.mount("https://", adapter)
+    return client
+
+
+def create_enrichment_client():
+    """Creates the client for the configured ENRICHMENT_BACKEND."""
+    if ENRICHMENT_BACKEND == "snapshot":
+        return SnapshotEngine(SNAPSHOT_DIR)
+    return create_bigquery_client()
+
+
+def build_analysis_chain():
+    """Builds the prompt | Gemini | parser chain used to write deal memos."""
+    from langchain.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+
+    # Retries are handled by GEMINI_GOVERNOR, so the client does not retry on its own.
+    llm = _load("ChatGoogleGenerativeAI")(model=GEMINI_MODEL, google_api_key=os.getenv("API_KEY"), max_retries=0)
+
+    prompt = PromptTemplate(
+        template=LOAN_ANALYSIS_PROMPT_TEMPLATE,
+        input_variables=["file_content", "bigquery_context"],
+    )
+
+    return prompt | llm | StrOutputParser()
+
+
+async def create_service_clients() -> ServiceClients:
+    """
+    Creates and warms up the shared clients. A client that cannot be created is
+    left as None so requests fall back to creating their own and surface the error.
+    """
+    clients = ServiceClients()
+
+    if ENRICHMENT_BACKEND == "snapshot":
+        try:
+            clients.snapshot_engine = await asyncio.to_thread(SnapshotEngine, SNAPSHOT_DIR)
+        except Exception as e:
+            print(f"Could not open snapshot directory {SNAPSHOT_DIR} at startup: {e}")
+    else:
+        try:
+            clients.bigquery_client = await asyncio.to_thread(create_bigquery_client)
+        except Exception as e:
+            print(f"Could not create BigQuery client at startup: {e}")
+
+    try:
+        clients.analysis_chain = await asyncio.to_thread(build_analysis_chain)
+    except Exception as e:
+        print(f"Could not create Gemini chain at startup: {e}")
+
+    await warm_up_service_clients(clients)
+    return clients
+
+
+async def warm_up_service_clients(clients: ServiceClients) -> None:
+    """Resolves credentials and opens a pooled connection before the first request."""
+    if clients.bigquery_client is None:
+        return
+    try:
+        await asyncio.to_thread(lambda: clients.bigquery_client.query("SELECT 1").result())
+    except Exception as e:
+        print(f"BigQuery warm-up query failed: {e}")
+
+
+def close_service_clients(clients: ServiceClients) -> None:
+    """Releases pooled connections held by the shared clients."""
+    if clients.bigquery_client is not None:
+        clients.bigquery_client.close()
+        clients.bigquery_client = None
+    clients.snapshot_engine = None
+    clients.analysis_chain = None
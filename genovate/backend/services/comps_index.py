@@ -0,0 +1,193 @@
+import bisect
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.snapshot import SnapshotEngine
+
+# Columns kept in the index for each comparables table. They match the columns the
+# enrichment queries select, so an indexed answer looks exactly like a BigQuery one.
+COMPS_COLUMNS = {
+    "realtor_data": ("city", "state", "price", "beds", "baths", "sqft"),
+    "commercial_real_estate": ("sale_price", "city", "state", "property_type", "year_built"),
+}
+# Within a partition, rows are ordered by size, then price, then year built.
+SORT_COLUMNS = ("sqft", "price", "sale_price", "year_built")
+
+
+def _number(value) -> Optional[float]:
+    """The value as a positive float, or None for missing, zero and unparseable values."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) and number > 0 else None
+
+
+def _normalize(value) -> Optional[str]:
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+class _Partition:
+    """Rows of one (state, city, property type) group, sorted by SORT_COLUMNS."""
+
+    def __init__(self, columns: Tuple[str, ...], rows: List[tuple]):
+        positions = [columns.index(c) for c in SORT_COLUMNS if c in columns]
+
+        def sort_key(row):
+            numbers = [_number(row[i]) for i in positions]
+            return tuple((number is None, number or 0.0) for number in numbers)
+
+        self.rows = sorted(rows, key=sort_key)
+        sqft_index = columns.index("sqft") if "sqft" in columns else None
+        # Rows without a size sort last; `sizes` covers only the sized prefix.
+        self.sizes = []
+        if sqft_index is not None:
+            for row in self.rows:
+                size = _number(row[sqft_index])
+                if size is None:
+                    break
+                self.sizes.append(size)
+        year_index = columns.index("year_built") if "year_built" in columns else None
+        self._year_index = year_index
+        self._by_recency: Optional[List[tuple]] = None
+
+    def nearest(self, sqft: Optional[float], k: int) -> List[tuple]:
+        """The k rows closest in size (by ratio) to `sqft`, or the k newest rows when no size applies."""
+        if sqft is None or not self.sizes:
+            return self._newest(k)
+        # Walk outwards from the insertion point, always taking the closer neighbour.
+        right = bisect.bisect_left(self.sizes, sqft)
+        left = right - 1
+        picked = []
+        while len(picked) < k and (left >= 0 or right < len(self.sizes)):
+            take_left = right >= len(self.sizes) or (
+                left >= 0 and abs(math.log(self.sizes[left] / sqft)) <= abs(math.log(self.sizes[right] / sqft))
+            )
+            if take_left:
+                picked.append(self.rows[left])
+                left -= 1
+            else:
+                picked.append(self.rows[right])
+                right += 1
+        return picked
+
+    def _newest(self, k: int) -> List[tuple]:
+        if self._year_index is None:
+            return self.rows[:k]
+        if self._by_recency is None:
+            index = self._year_index
+            self._by_recency = sorted(self.rows, key=lambda row: -(_number(row[index]) or 0.0))
+        return self._by_recency[:k]
+
+
+class ComparablesIndex:
+    """
+    An in-memory index of market comparables, partitioned by state, city and
+    property type, each partition sorted by square footage. `nearest` answers a
+    comps lookup in O(log n + k) instead of scanning the table, and returns the
+    closest comps rather than the first ones that match a size window.
+
+    The index is rebuilt off to the side and swapped in by `replace`, so lookups
+    never see a partial refresh.
+    """
+
+    def __init__(self):
+        self._partitions: Dict[str, Dict[tuple, _Partition]] = {}
+        self._info: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_partitions(table: str, rows: Iterable[dict]) -> Tuple[Dict[tuple, _Partition], int]:
+        """Groups `rows` (dicts with the COMPS_COLUMNS of `table`) into sorted partitions."""
+        columns = COMPS_COLUMNS[table]
+        groups: Dict[tuple, List[tuple]] = {}
+        count = 0
+        for row in rows:
+            state = row.get("state")
+            if not state:
+                continue
+            values = tuple(row.get(column) for column in columns)
+            city = _normalize(row.get("city"))
+            property_type = _normalize(row.get("property_type"))
+            # Each row is reachable from the city and the state partitions, with and
+            # without its property type, matching the filters a lookup may use.
+            for key in {(state, city, property_type), (state, city, None), (state, None, property_type), (state, None, None)}:
+                groups.setdefault(key, []).append(values)
+            count += 1
+        return {key: _Partition(columns, group_rows) for key, group_rows in groups.items()}, count
+
+    def replace(self, table: str, rows: Iterable[dict]) -> int:
+        """Rebuilds the index for `table` from `rows` and swaps it in. Returns the number of rows indexed."""
+        partitions, count = self.build_partitions(table, rows)
+        with self._lock:
+            self._partitions[table] = partitions
+            self._info[table] = {"rows": count, "partitions": len(partitions), "loaded_at": time.time()}
+        return count
+
+    def is_loaded(self, table: str) -> bool:
+        return table in self._partitions
+
+    def nearest(
+        self,
+        table: str,
+        state: str,
+        city: Optional[str] = None,
+        property_type: Optional[str] = None,
+        sqft: Optional[float] = None,
+        k: int = 5,
+    ) -> List[dict]:
+        """
+        Returns up to `k` comps as dicts of COMPS_COLUMNS[table], nearest in size
+        first. Comps from the same city are preferred; when the city has fewer than
+        `k`, the nearest comps elsewhere in the state fill the remaining places.
+        """
+        partitions = self._partitions.get(table)
+        if partitions is None:
+            raise LookupError(f"The comparables index has not been loaded for {table}")
+        columns = COMPS_COLUMNS[table]
+        property_type = _normalize(property_type)
+
+        picked = []
+        city = _normalize(city)
+        if city is not None:
+            partition = partitions.get((state, city, property_type))
+            if partition is not None:
+                picked = partition.nearest(sqft, k)
+        if len(picked) < k:
+            partition = partitions.get((state, None, property_type))
+            if partition is not None:
+                seen = set(map(id, picked))
+                extra = [row for row in partition.nearest(sqft, k + len(picked)) if id(row) not in seen]
+                picked = picked + extra[:k - len(picked)]
+        return [dict(zip(columns, row)) for row in picked]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {table: dict(info) for table, info in self._info.items()}
+
+
+def query_targets(query) -> dict:
+    """
+    Translates an EnrichmentQuery into `nearest` arguments. The target size is the
+    query's exact `target_sqft`, or the centre of its sqft window if it has none.
+    """
+    targets = {"k": query.limit}
+    for column, op, value in query.filters:
+        if column == "sqft" and op == "between":
+            targets["sqft"] = (value[0] + value[1]) / 2
+        elif column in ("state", "city", "property_type"):
+            targets[column] = value
+    if query.target_sqft:
+        targets["sqft"] = query.target_sqft
+    return targets
+
+
+def read_comps_rows(client, table: str, table_id: str) -> Iterable[dict]:
+    """Streams the indexed columns of `table` from BigQuery, or from a SnapshotEngine."""
+    columns = COMPS_COLUMNS[table]
+    if isinstance(client, SnapshotEngine):
+        return client.scan_table(table, columns)
+    sql = f"SELECT {', '.join(columns)} FROM `{table_id}` WHERE state IS NOT NULL"
+    return (dict(row.items()) for row in client.query(sql).result(page_size=50_000))
@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import re
+from typing import List, Optional, Tuple
+
+# Gemini averages roughly four characters of English text per token. The estimate
+# only needs to be good enough to keep prompts inside their budgets.
+CHARS_PER_TOKEN = 4
+PROMPT_DOCUMENT_TOKEN_BUDGET = int(os.getenv("PROMPT_DOCUMENT_TOKEN_BUDGET", "24000"))
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "4000"))
+# Paragraphs longer than this are split so relevance is scored on smaller pieces.
+MAX_CHUNK_CHARS = 2000
+
+RELEVANCE_TERMS = re.compile(
+    r"\b(?:rent|rents|rental|noi|net operating income|cap rate|occupancy|occupied|vacancy|vacant|"
+    r"lease|leases|tenant|tenants|price|purchase|sale|sqft|sf|square feet|unit|units|expense|expenses|"
+    r"taxes|insurance|debt|loan|ltv|dscr|year built|renovat\w*|flood|zoning|appraisal|valuation)\b",
+    re.IGNORECASE,
+)
+NUMBER = re.compile(r"[$%]|\d")
+# Only explicit page markers ("Page 3", "Page 3 of 9", "- 3 -"). A bare number on its
+# own line is usually a table value split out by PDF text extraction.
+PAGE_NUMBER_LINE = re.compile(r"^\s*(?:page\s+\d+(?:\s+of\s+\d+)?|-\s*\d+\s*-)\s*$", re.IGNORECASE)
+SEPARATOR_LINE = re.compile(r"^\s*[-=_*.~#]{3,}\s*$")
+
+
+def count_tokens(text: str) -> int:
+    """Estimates the number of model tokens in `text`."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _is_page_break(line: str) -> bool:
+    return line == "\f" or bool(PAGE_NUMBER_LINE.match(line) or SEPARATOR_LINE.match(line))
+
+
+def strip_boilerplate(text: str) -> str:
+    """
+    Removes text that costs tokens without informing the memo: page numbers,
+    separator rules, page headers and footers, runs of spaces and blank lines.
+
+    A header or footer is a short line without figures that recurs three or more
+    times and only ever sits at a page edge: the start or end of the document, or
+    next to a page break (form feed, page marker or separator rule). Repeated lines
+    inside the page, such as table cells, are kept.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\f", "\n\f\n")
+    lines = [line if line == "\f" else re.sub(r"[ \t]+", " ", line).strip() for line in text.split("\n")]
+
+    content = [i for i, line in enumerate(lines) if line and not _is_page_break(line)]
+    counts = {}
+    at_edge = {}
+    for position, i in enumerate(content):
+        line = lines[i]
+        before = content[position - 1] if position > 0 else -1
+        after = content[position + 1] if position + 1 < len(content) else len(lines)
+        edge = any(_is_page_break(lines[j]) for j in range(before + 1, i)) or before < 0
+        edge = edge or any(_is_page_break(lines[j]) for j in range(i + 1, after)) or after == len(lines)
+        counts[line] = counts.get(line, 0) + 1
+        at_edge[line] = at_edge.get(line, True) and edge
+
+    kept = []
+    for line in lines:
+        if not line or line == "\f":
+            if kept and kept[-1]:
+                kept.append("")
+            continue
+        if _is_page_break(line):
+            continue
+        if counts[line] >= 3 and at_edge[line] and len(line) < 120 and not NUMBER.search(line):
+            continue
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def _split_chunks(text: str) -> List[str]:
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > MAX_CHUNK_CHARS:
+            cut = paragraph.rfind("\n", 0, MAX_CHUNK_CHARS)
+            if cut <= 0:
+                cut = paragraph.rfind(" ", 0, MAX_CHUNK_CHARS)
+            if cut <= 0:
+                cut = MAX_CHUNK_CHARS
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            chunks.append(paragraph)
+    return chunks
+
+
+def _score_chunk(chunk: str, terms: List[str]) -> float:
+    score = len(RELEVANCE_TERMS.findall(chunk)) * 2.0
+    score += sum(3.0 for term in terms if term in chunk)
+    score += min(len(NUMBER.findall(chunk)) / 10.0, 5.0)
+    # Favour dense chunks over long ones with the same number of hits.
+    return score / math.sqrt(max(count_tokens(chunk), 1))
+
+
+def select_relevant_chunks(text: str, budget_tokens: int, terms: Optional[List[str]] = None) -> str:
+    """
+    Keeps the most relevant paragraphs of `text` that fit in `budget_tokens`, in
+    their original order. The first paragraph (usually the title or summary) is
+    always kept. Gaps left by dropped paragraphs are marked with "[...]".
+    """
+    if count_tokens(text) <= budget_tokens:
+        return text
+
+    chunks = _split_chunks(text)
+    terms = [term for term in (terms or []) if term]
+    ranked = sorted(range(1, len(chunks)), key=lambda i: _score_chunk(chunks[i], terms), reverse=True)
+
+    selected = set()
+    used = 0
+    for index in [0] + ranked:
+        cost = count_tokens(chunks[index]) + 1
+        if used + cost > budget_tokens:
+            continue
+        selected.add(index)
+        used += cost
+
+    parts = []
+    for index, chunk in enumerate(chunks):
+        if index in selected:
+            parts.append(chunk)
+        elif not parts or parts[-1] != "[...]":
+            parts.append("[...]")
+    return "\n\n".join(parts)
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def encode_rows_compact(rows: List[dict]) -> str:
+    """
+    Encodes result rows as a pipe-separated table with a single header line, which
+    avoids repeating every column name and quote in each JSON record.
+    """
+    columns = []
+    for row in rows:
+        for column in row:
+            if column not in columns:
+                columns.append(column)
+    lines = [" | ".join(columns)]
+    for row in rows:
+        lines.append(" | ".join(_format_value(row.get(column)) for column in columns))
+    return "\n".join(lines)
+
+
+def compact_bigquery_context(context: str, budget_tokens: int) -> str:
+    """
+    Re-encodes the JSON record sections of the BigQuery context as compact tables
+    and trims it to `budget_tokens`. Sections that are not JSON are kept as is.
+    """
+    sections = []
+    for section in context.split("\n\n"):
+        label, _, body = section.partition(":\n")
+        try:
+            rows = json.loads(body)
+        except ValueError:
+            rows = None
+        if body and isinstance(rows, list) and rows and all(isinstance(row, dict) for row in rows):
+            sections.append(f"{label}:\n{encode_rows_compact(rows)}")
+        else:
+            sections.append(section)
+
+    compacted = "\n\n".join(sections)
+    max_chars = budget_tokens * CHARS_PER_TOKEN
+    if len(compacted) > max_chars:
+        compacted = compacted[:max_chars].rsplit("\n", 1)[0] + "\n[BigQuery context truncated to fit the prompt budget]"
+    return compacted
+
+
+def budget_prompt_inputs(
+    inputs: dict,
+    terms: Optional[List[str]] = None,
+    document_budget: int = PROMPT_DOCUMENT_TOKEN_BUDGET,
+    context_budget: int = PROMPT_CONTEXT_TOKEN_BUDGET,
+) -> Tuple[dict, dict]:
+    """
+    Shrinks the prompt inputs to their token budgets: a document over its budget has
+    its boilerplate stripped and its most relevant paragraphs kept (`terms`, e.g. the
+    extracted city and state, count towards relevance), and the BigQuery context is
+    compacted.
+
+    Returns the new inputs and a report of the tokens saved in each section.
+    """
+    file_content = inputs["file_content"]
+    if count_tokens(file_content) > document_budget:
+        file_content = select_relevant_chunks(strip_boilerplate(file_content), document_budget, terms)
+    bigquery_context = compact_bigquery_context(inputs["bigquery_context"], context_budget)
+
+    report = {}
+    for name, before, after in (
+        ("file_content", inputs["file_content"], file_content),
+        ("bigquery_context", inputs["bigquery_context"], bigquery_context),
+    ):
+        original_tokens = count_tokens(before)
+        final_tokens = count_tokens(after)
+        report[name] = {
+            "original_tokens": original_tokens,
+            "final_tokens": final_tokens,
+            "saved_tokens": original_tokens - final_tokens,
+        }
+
+    return {**inputs, "file_content": file_content, "bigquery_context": bigquery_context}, report
@@ -0,0 +1,266 @@
+import asyncio
+import concurrent.futures
+import os
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+from services.metrics import GOVERNOR_RETRIES, GOVERNOR_THROTTLED, GOVERNOR_WAITING
+
+GOVERNOR_MAX_RETRIES = int(os.getenv("GOVERNOR_MAX_RETRIES", "3"))
+GOVERNOR_RETRY_BASE_SECONDS = float(os.getenv("GOVERNOR_RETRY_BASE_SECONDS", "0.5"))
+GOVERNOR_RETRY_MAX_SECONDS = float(os.getenv("GOVERNOR_RETRY_MAX_SECONDS", "8"))
+# Consecutive failed calls that open a circuit, and how long it stays open.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Defaults sit below the project quotas so bursts queue here instead of erroring upstream.
+GEMINI_REQUESTS_PER_SECOND = float(os.getenv("GEMINI_REQUESTS_PER_SECOND", "5"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "10"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+BIGQUERY_QUERIES_PER_SECOND = float(os.getenv("BIGQUERY_QUERIES_PER_SECOND", "40"))
+BIGQUERY_BURST = int(os.getenv("BIGQUERY_BURST", "80"))
+BIGQUERY_MAX_CONCURRENCY = int(os.getenv("BIGQUERY_MAX_CONCURRENCY", "50"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable after repeated failures; retry in {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for quota, rate-limit and transient server errors from Google APIs."""
+    from google.api_core.exceptions import (
+        BadGateway,
+        Forbidden,
+        GatewayTimeout,
+        InternalServerError,
+        ServiceUnavailable,
+        TooManyRequests,
+    )
+
+    if isinstance(error, (TooManyRequests, ServiceUnavailable, InternalServerError, BadGateway, GatewayTimeout)):
+        return True
+    # BigQuery reports its concurrent-job and rate limits as 403 rateLimitExceeded.
+    return isinstance(error, Forbidden) and "rateLimitExceeded" in str(error)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> bool:
+        """Takes one token, waiting for it if necessary. Returns True if the caller had to wait."""
+        waited = False
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return waited
+            waited = True
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets one trial call through (half-open) and
+    closes again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self, name: str) -> bool:
+        """Raises CircuitOpenError if the call must not go ahead. Returns True if it is the half-open trial."""
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_in_flight):
+            remaining = max(self.reset_timeout - (time.monotonic() - self.opened_at), 1)
+            raise CircuitOpenError(name, remaining)
+        if state == "half_open":
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def cancel_trial(self) -> None:
+        """Lets another trial call through after a half-open trial ended without a result."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class Governor:
+    """
+    Client-side limits for one upstream dependency: a token-bucket rate limit, a
+    bound on concurrent calls, jittered exponential retry of retryable errors and a
+    circuit breaker that fails fast while the dependency keeps failing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        max_retries: int = GOVERNOR_MAX_RETRIES,
+        retry_base: float = GOVERNOR_RETRY_BASE_SECONDS,
+        retry_max: float = GOVERNOR_RETRY_MAX_SECONDS,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker = breaker or CircuitBreaker()
+        # asyncio primitives belong to one event loop; keep a semaphore per loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.waiting = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Holds one rate-limited, concurrency-limited slot for a single call. Retryable
+        errors and timeouts count towards opening the circuit; nothing is retried.
+        """
+        try:
+            trial = self.breaker.before_call(self.name)
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+
+        semaphore = self._semaphore()
+        acquired = False
+        recorded = False
+        try:
+            self.waiting += 1
+            GOVERNOR_WAITING.labels(self.name).inc()
+            try:
+                if semaphore.locked():
+                    self.throttled += 1
+                    GOVERNOR_THROTTLED.labels(self.name, "concurrency").inc()
+                await semaphore.acquire()
+                acquired = True
+                if await self.bucket.acquire():
+                    self.throttled += 1
+                    GOVERNOR_THROTTLED.labels(self.name, "rate").inc()
+            finally:
+                self.waiting -= 1
+                GOVERNOR_WAITING.labels(self.name).dec()
+
+            self.in_flight += 1
+            try:
+                yield
+            except Exception as e:
+                recorded = True
+                if is_retryable(e) or isinstance(e, (asyncio.TimeoutError, concurrent.futures.TimeoutError)):
+                    self.failures += 1
+                    self.breaker.record_failure()
+                else:
+                    # The dependency answered; the request itself was bad.
+                    self.breaker.record_success()
+                raise
+            else:
+                recorded = True
+                self.breaker.record_success()
+            finally:
+                self.in_flight -= 1
+        finally:
+            if acquired:
+                semaphore.release()
+            # Cancelled while waiting or mid-call, or a stream closed early
+            # (GeneratorExit): no verdict, so let the next call be the trial.
+            if trial and not recorded:
+                self.breaker.cancel_trial()
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads retries from many callers over the whole window.
+        return random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs `fn()` inside a slot, retrying retryable errors with jittered exponential backoff."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot():
+                    return await fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                GOVERNOR_RETRIES.labels(self.name).inc()
+                delay = self._backoff(attempt)
+                print(f"{self.name} call failed with a retryable error, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": self.bucket.rate,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "circuit": self.breaker.state,
+        }
+
+
+GEMINI_GOVERNOR = Governor("gemini", GEMINI_REQUESTS_PER_SECOND, GEMINI_BURST, GEMINI_MAX_CONCURRENCY)
+BIGQUERY_GOVERNOR = Governor("bigquery", BIGQUERY_QUERIES_PER_SECOND, BIGQUERY_BURST, BIGQUERY_MAX_CONCURRENCY)
+
+
+def get_governor_stats() -> dict:
+    """Returns queue depth, throttle, retry and circuit state for each governed dependency."""
+    return {governor.name: governor.stats() for governor in (GEMINI_GOVERNOR, BIGQUERY_GOVERNOR)}
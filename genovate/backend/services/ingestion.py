@@ -0,0 +1,147 @@
+import asyncio
+import codecs
+import csv
+import os
+from typing import Iterator, List
+
+# Uploads are read in chunks of this size, so a worker never holds the raw file in memory.
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Extracted text beyond this many characters is dropped; the prompt budget keeps far less.
+MAX_EXTRACTED_CHARS = int(os.getenv("MAX_EXTRACTED_CHARS", str(2_000_000)))
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+CSV_EXTENSIONS = (".csv",)
+PDF_EXTENSIONS = (".pdf",)
+
+
+class UploadError(ValueError):
+    """Raised when an upload cannot be turned into text. `status_code` is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _upload_kind(filename: str, content_type: str) -> str:
+    name = (filename or "").lower()
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if name.endswith(PDF_EXTENSIONS) or content_type == "application/pdf":
+        return "pdf"
+    if name.endswith(CSV_EXTENSIONS) or content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if name.endswith(TEXT_EXTENSIONS) or content_type.startswith("text/"):
+        return "text"
+    raise UploadError("Unsupported file type. Please upload a .txt, .md, .csv or .pdf file.", status_code=415)
+
+
+async def _iter_decoded_chunks(upload):
+    """Yields the upload as decoded text, one chunk at a time, enforcing MAX_UPLOAD_BYTES."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    total = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > MAX_UPLOAD_BYTES:
+            raise UploadError(f"File is larger than the {MAX_UPLOAD_BYTES} byte limit.", status_code=413)
+        yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _read_text(upload) -> str:
+    parts: List[str] = []
+    size = 0
+    async for text in _iter_decoded_chunks(upload):
+        parts.append(text[:MAX_EXTRACTED_CHARS - size])
+        size += len(parts[-1])
+        if size >= MAX_EXTRACTED_CHARS:
+            break
+    return "".join(parts)
+
+
+async def _read_csv(upload) -> str:
+    """
+    Converts a CSV (e.g. a rent roll) to pipe-separated lines. Rows are parsed as
+    they arrive, so only the current partial line is buffered.
+    """
+    lines: List[str] = []
+    size = 0
+    pending = ""
+
+    def complete_lines(text: str, final: bool) -> Iterator[str]:
+        nonlocal pending
+        pending += text
+        if final:
+            rest, pending = pending, ""
+            return iter(rest.splitlines(keepends=True))
+        head, sep, rest = pending.rpartition("\n")
+        if head.count('"') % 2:
+            # The last newline is inside a quoted field; wait for the rest of the row.
+            return iter(())
+        pending = rest
+        return iter((head + sep).splitlines(keepends=True))
+
+    def add_rows(raw_lines: Iterator[str]) -> bool:
+        nonlocal size
+        for row in csv.reader(raw_lines):
+            if not any(cell.strip() for cell in row):
+                continue
+            line = " | ".join(cell.strip() for cell in row)
+            lines.append(line)
+            size += len(line) + 1
+            if size >= MAX_EXTRACTED_CHARS:
+                return False
+        return True
+
+    async for text in _iter_decoded_chunks(upload):
+        if not add_rows(complete_lines(text, final=False)):
+            return "\n".join(lines)
+    add_rows(complete_lines("", final=True))
+    return "\n".join(lines)
+
+
+def _read_pdf_file(file) -> str:
+    """Extracts text page by page from a seekable PDF file object."""
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError:
+        raise UploadError("PDF uploads require the pypdf package on the server.", status_code=415)
+
+    file.seek(0, os.SEEK_END)
+    if file.tell() > MAX_UPLOAD_BYTES:
+        raise UploadError(f"File is larger than the {MAX_UPLOAD_BYTES} byte limit.", status_code=413)
+    file.seek(0)
+
+    try:
+        reader = PdfReader(file)
+        parts: List[str] = []
+        size = 0
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            parts.append(text[:MAX_EXTRACTED_CHARS - size])
+            size += len(parts[-1])
+            if size >= MAX_EXTRACTED_CHARS:
+                break
+    except PdfReadError as e:
+        raise UploadError(f"Could not read PDF: {e}")
+    return "\n\n".join(parts)
+
+
+async def extract_text_from_upload(upload) -> str:
+    """
+    Converts an uploaded document (a FastAPI UploadFile or anything with `filename`,
+    `content_type`, an async `read(size)` and a seekable `file`) to plain text for
+    the analysis pipeline. Text and CSV are decoded incrementally; PDFs are read
+    page by page in a worker thread from the spooled temporary file.
+    """
+    kind = _upload_kind(upload.filename, upload.content_type)
+    if kind == "pdf":
+        return await asyncio.to_thread(_read_pdf_file, upload.file)
+    if kind == "csv":
+        return await _read_csv(upload)
+    return await _read_text(upload)
@@ -0,0 +1,228 @@
+import asyncio
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.metrics import JOB_QUEUE_DEPTH
+
+# Queued /analyze jobs beyond this are rejected with 429 instead of piling up.
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "4"))
+# Set JOB_QUEUE_DB to a file path to keep jobs in SQLite, so queued jobs survive a restart.
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB")
+# Finished jobs are kept for polling this long before they are discarded.
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+
+
+class QueueFullError(Exception):
+    """Raised by `JobQueue.submit` when the queue is at capacity."""
+
+
+@dataclass
+class AnalysisJob:
+    """One queued /analyze request. Higher `priority` jobs run first."""
+    id: str
+    file_content: Optional[str] = field(default=None, repr=False)
+    priority: int = 0
+    status: str = "queued"
+    memo: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        result = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "completed":
+            result["memo"] = self.memo
+        elif self.status == "failed":
+            result["error"] = self.error
+        return result
+
+
+class _JobDatabase:
+    """SQLite persistence for AnalysisJob records. Calls are serialized with a lock."""
+
+    COLUMNS = ("id", "file_content", "priority", "status", "memo", "error", "created_at", "started_at", "finished_at")
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+                "id TEXT PRIMARY KEY, file_content TEXT, priority INTEGER, status TEXT, memo TEXT, "
+                "error TEXT, created_at REAL, started_at REAL, finished_at REAL)"
+            )
+
+    def save(self, job: AnalysisJob) -> None:
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO analysis_jobs ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                tuple(getattr(job, column) for column in self.COLUMNS),
+            )
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM analysis_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return AnalysisJob(**dict(zip(self.COLUMNS, row))) if row else None
+
+    def unfinished(self) -> List[AnalysisJob]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM analysis_jobs "
+                "WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [AnalysisJob(**dict(zip(self.COLUMNS, row))) for row in rows]
+
+    def prune(self, cutoff: float) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM analysis_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class JobQueue:
+    """
+    A bounded priority queue of analysis jobs served by a pool of worker tasks.
+
+    `handler(file_content)` produces the memo for a job. Submitting to a full queue
+    raises QueueFullError so callers can apply backpressure. With `db_path`, jobs are
+    stored in SQLite and jobs left queued or running by a previous process are
+    re-queued on `start`.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str], Awaitable[str]],
+        workers: int = JOB_QUEUE_WORKERS,
+        max_size: int = JOB_QUEUE_MAX_SIZE,
+        db_path: Optional[str] = JOB_QUEUE_DB,
+        ttl: float = JOB_TTL_SECONDS,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.ttl = ttl
+        self._db = _JobDatabase(db_path) if db_path else None
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        # Slots taken by submits still writing their job to SQLite.
+        self._reserved = 0
+        self.running = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        # max_size is enforced in submit, so jobs recovered from SQLite always fit.
+        self._queue = asyncio.PriorityQueue()
+        if self._db is not None:
+            for job in await asyncio.to_thread(self._db.unfinished):
+                job.status = "queued"
+                job.started_at = None
+                self._jobs[job.id] = job
+                self._enqueue(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._db is not None:
+            self._db.close()
+
+    def _enqueue(self, job: AnalysisJob) -> None:
+        # Lower tuples are served first: highest priority, then oldest.
+        self._queue.put_nowait((-job.priority, next(self._sequence), job.id))
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def submit(self, file_content: str, priority: int = 0) -> AnalysisJob:
+        if self._queue is None:
+            raise RuntimeError("The job queue has not been started.")
+        # The slot is reserved before the first await, so concurrent submits cannot
+        # all pass the check while their jobs are being saved.
+        if self._queue.qsize() + self._reserved >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(f"The analysis queue is full ({self.max_size} jobs).")
+        self._reserved += 1
+        try:
+            self._prune()
+            job = AnalysisJob(id=uuid.uuid4().hex, file_content=file_content, priority=priority)
+            if self._db is not None:
+                await asyncio.to_thread(self._db.prune, time.time() - self.ttl)
+                await asyncio.to_thread(self._db.save, job)
+            self._jobs[job.id] = job
+            self._enqueue(job)
+        finally:
+            self._reserved -= 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[AnalysisJob]:
+        job = self._jobs.get(job_id)
+        if job is None and self._db is not None:
+            job = await asyncio.to_thread(self._db.get, job_id)
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            JOB_QUEUE_DEPTH.set(self._queue.qsize())
+            job = self._jobs.get(job_id)
+            if job is None:
+                self._queue.task_done()
+                continue
+            self.running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                if self._db is not None:
+                    await asyncio.to_thread(self._db.save, job)
+                job.memo = await self.handler(job.file_content)
+                job.status = "completed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"An error occurred during queued analysis {job.id}: {e}")
+                job.error = f"An internal error occurred during analysis: {str(e)}"
+                job.status = "failed"
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+            job.finished_at = time.time()
+            job.file_content = None
+            if self._db is not None:
+                await asyncio.to_thread(self._db.save, job)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "rejected": self.rejected,
+        }
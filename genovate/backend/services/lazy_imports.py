@@ -0,0 +1,27 @@
+import importlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def lazy_importer(module_globals: dict, imports: Dict[str, Tuple[str, Optional[str]]]) -> Callable[[str], Any]:
+    """
+    Returns a loader for module-level names that are only imported on first use,
+    keeping heavy client libraries out of the import path of `main`.
+
+    `imports` maps each name to (module, attribute); attribute None means the module
+    itself. Loaded values are stored in `module_globals`, so a value set there (e.g.
+    by unittest.mock.patch) takes precedence. Assign the loader to the module's
+    `__getattr__` so `module.name` keeps working for callers and patches.
+    """
+    def load(name: str) -> Any:
+        if name in module_globals:
+            return module_globals[name]
+        if name not in imports:
+            raise AttributeError(f"module {module_globals['__name__']!r} has no attribute {name!r}")
+        module_name, attribute = imports[name]
+        value = importlib.import_module(module_name)
+        if attribute is not None:
+            value = getattr(value, attribute)
+        module_globals[name] = value
+        return value
+
+    return load
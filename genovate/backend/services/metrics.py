@@ -0,0 +1,167 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Requests slower than this are logged with their per-stage breakdown.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "20"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "analysis_request_duration_seconds",
+    "End-to-end duration of an analysis operation.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "analysis_stage_duration_seconds",
+    "Duration of each stage of an analysis (extraction, each BigQuery query, LLM, ...).",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "analysis_llm_tokens_total",
+    "Tokens reported by Gemini, by direction.",
+    ["direction"],
+)
+BIGQUERY_BYTES_PROCESSED = Counter(
+    "analysis_bigquery_bytes_processed_total",
+    "Bytes processed by BigQuery enrichment queries, by table.",
+    ["table"],
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "analysis_job_queue_depth",
+    "Analysis jobs waiting in the job queue.",
+)
+GOVERNOR_WAITING = Gauge(
+    "upstream_calls_waiting",
+    "Calls waiting for a rate-limit token or concurrency slot, by dependency.",
+    ["dependency"],
+)
+GOVERNOR_THROTTLED = Counter(
+    "upstream_calls_throttled_total",
+    "Calls delayed by the client-side rate limit or concurrency bound, by dependency and reason.",
+    ["dependency", "reason"],
+)
+GOVERNOR_RETRIES = Counter(
+    "upstream_call_retries_total",
+    "Retries of calls that failed with a retryable error, by dependency.",
+    ["dependency"],
+)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("analysis_trace", default=None)
+
+
+class RequestTrace:
+    """The timed stages of one analysis operation."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.attributes = {}
+
+    def to_dict(self, duration: float) -> dict:
+        return {
+            "operation": self.operation,
+            "duration_seconds": round(duration, 4),
+            "stages": [{"stage": name, "seconds": round(seconds, 4)} for name, seconds in self.spans],
+            **self.attributes,
+        }
+
+
+@contextmanager
+def request_trace(operation: str):
+    """
+    Times an analysis operation. Stages timed inside it (including in worker threads
+    and tasks started from it) are attached to the trace, and a trace slower than
+    SLOW_REQUEST_SECONDS is logged with its breakdown. Nested calls reuse the outer trace.
+    """
+    if _current_trace.get() is not None:
+        yield _current_trace.get()
+        return
+
+    trace = RequestTrace(operation)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming generator closed from another context (e.g. on disconnect).
+            _current_trace.set(None)
+        duration = time.perf_counter() - trace.started
+        REQUEST_SECONDS.labels(operation).observe(duration)
+        if duration >= SLOW_REQUEST_SECONDS:
+            print(f"Slow analysis request: {json.dumps(trace.to_dict(duration))}")
+
+
+@contextmanager
+def stage(name: str):
+    """Times one stage, records it in the stage histogram and the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, elapsed))
+
+
+def record_bigquery_bytes(table: str, bytes_processed) -> None:
+    if isinstance(bytes_processed, int) and bytes_processed > 0:
+        BIGQUERY_BYTES_PROCESSED.labels(table).inc(bytes_processed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.attributes["bigquery_bytes_processed"] = trace.attributes.get("bigquery_bytes_processed", 0) + bytes_processed
+
+
+@lru_cache(maxsize=None)
+def _token_usage_callback_class():
+    # Defined on first use so importing this module does not import langchain_core.
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageCallback(BaseCallbackHandler):
+        """LangChain callback that records the token usage Gemini reports for each call."""
+
+        def on_llm_end(self, response, **kwargs) -> None:
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                    if not usage:
+                        continue
+                    input_tokens = usage.get("input_tokens", 0)
+                    output_tokens = usage.get("output_tokens", 0)
+                    LLM_TOKENS.labels("input").inc(input_tokens)
+                    LLM_TOKENS.labels("output").inc(output_tokens)
+                    trace = _current_trace.get()
+                    if trace is not None:
+                        trace.attributes["llm_input_tokens"] = trace.attributes.get("llm_input_tokens", 0) + input_tokens
+                        trace.attributes["llm_output_tokens"] = trace.attributes.get("llm_output_tokens", 0) + output_tokens
+
+    return TokenUsageCallback
+
+
+def token_usage_callback():
+    """Returns a LangChain callback that records the token usage Gemini reports."""
+    return _token_usage_callback_class()()
+
+
+def __getattr__(name: str):
+    if name == "TokenUsageCallback":
+        return _token_usage_callback_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Returns the Prometheus exposition payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
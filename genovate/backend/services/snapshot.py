@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Iterator, Optional
+
+# pyarrow is imported where it is used, so the API does not pay for it unless
+# ENRICHMENT_BACKEND=snapshot.
+
+MANIFEST_FILENAME = "snapshot.json"
+# Hive partition columns per table, so lookups by state only read matching files.
+# The comps tables have thousands of cities, far too many for one directory each;
+# their rows are sorted by city instead, so a city's rows share a few row groups.
+SNAPSHOT_PARTITIONS = {
+    "realtor_data": ("state",),
+    "commercial_real_estate": ("state",),
+    "nfip_losses_by_state": ("state",),
+    "safmrs_revised": ("state",),
+}
+SNAPSHOT_SORT_COLUMNS = ("state", "city")
+SNAPSHOT_ROW_GROUP_ROWS = 64 * 1024
+
+
+def _partitioning(columns) -> Optional["ds.Partitioning"]:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if not columns:
+        return None
+    return ds.partitioning(pa.schema([(column, pa.string()) for column in columns]), flavor="hive")
+
+
+def export_snapshot(client, directory: str, tables: dict) -> dict:
+    """
+    Exports BigQuery tables to partitioned Parquet datasets under `directory`.
+
+    `tables` maps snapshot table names to fully qualified BigQuery table ids. Each
+    export of a table goes to a new versioned directory, and the manifest, which
+    names the current directory of every table, is replaced atomically once they
+    are all written. The previous version is kept, so a running SnapshotEngine can
+    finish reading it before it picks up the new manifest.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+    manifest = {"tables": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    for name, table_id in tables.items():
+        print(f"Exporting {table_id} ...")
+        table = client.list_rows(table_id).to_arrow()
+        partition_columns = [c for c in SNAPSHOT_PARTITIONS.get(name, ()) if c in table.column_names]
+        for column in partition_columns:
+            index = table.schema.get_field_index(column)
+            table = table.set_column(index, column, pc.cast(table[column], pa.string()))
+        sort_columns = [c for c in SNAPSHOT_SORT_COLUMNS if c in table.column_names]
+        if sort_columns:
+            table = table.sort_by([(column, "ascending") for column in sort_columns])
+        partitions = table.group_by(partition_columns).aggregate([]).num_rows if partition_columns else 1
+
+        version = f"{name}@{time.time_ns()}"
+        staging = os.path.join(directory, f".{name}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        ds.write_dataset(
+            table,
+            staging,
+            format="parquet",
+            partitioning=_partitioning(partition_columns),
+            existing_data_behavior="overwrite_or_ignore",
+            # pyarrow refuses to write more than 1024 partitions unless told otherwise.
+            max_partitions=max(partitions, 1024),
+            max_rows_per_group=SNAPSHOT_ROW_GROUP_ROWS,
+            min_rows_per_group=min(SNAPSHOT_ROW_GROUP_ROWS, max(table.num_rows, 1)),
+        )
+        os.replace(staging, os.path.join(directory, version))
+
+        previous = manifest["tables"].get(name, {})
+        manifest["tables"][name] = {
+            "path": version,
+            "previous_path": previous.get("path", name if previous else None),
+            "source": table_id,
+            "rows": table.num_rows,
+            "partitioning": partition_columns,
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    # Drop versions older than the previous one; no engine can still be reading them.
+    for name in tables:
+        keep = {manifest["tables"][name]["path"], manifest["tables"][name]["previous_path"]}
+        for entry in os.listdir(directory):
+            if (entry == name or entry.startswith(f"{name}@")) and entry not in keep:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return manifest
+
+
+class SnapshotEngine:
+    """
+    Answers enrichment queries in-process from Parquet snapshots written by
+    `export_snapshot`. Filters are pushed down into the dataset scan, so partitions
+    and row groups that cannot match are skipped.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest = {"tables": {}}
+        self._manifest_version = None
+        self._datasets = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _manifest_stat(self) -> tuple:
+        # export_snapshot replaces the manifest, so a new export changes its inode.
+        stat = os.stat(os.path.join(self.directory, MANIFEST_FILENAME))
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def reload(self) -> None:
+        """Re-reads the manifest and drops opened datasets after a new export."""
+        version = self._manifest_stat()
+        with open(os.path.join(self.directory, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with self._lock:
+            self.manifest = manifest
+            self._manifest_version = version
+            self._datasets = {}
+
+    def refresh(self) -> bool:
+        """Reloads the snapshot if it was re-exported since it was read. Returns True if it was."""
+        if self._manifest_stat() == self._manifest_version:
+            return False
+        self.reload()
+        return True
+
+    def _dataset(self, table: str) -> "ds.Dataset":
+        import pyarrow.dataset as ds
+
+        with self._lock:
+            dataset = self._datasets.get(table)
+            if dataset is None:
+                info = self.manifest["tables"].get(table)
+                if info is None:
+                    raise LookupError(f"Table {table} is not in the snapshot at {self.directory}")
+                dataset = ds.dataset(
+                    # Snapshots exported before versioned directories use the table name.
+                    os.path.join(self.directory, info.get("path", table)),
+                    format="parquet",
+                    partitioning=_partitioning(info["partitioning"]),
+                )
+                self._datasets[table] = dataset
+            return dataset
+
+    def run_query(self, query) -> list:
+        """Runs an EnrichmentQuery against the snapshot and returns its rows as dicts."""
+        import pyarrow.compute as pc
+
+        dataset = self._dataset(query.table)
+
+        expression = None
+        for column, op, value in query.filters:
+            field = pc.field(column)
+            if op == "=":
+                condition = field == value
+            elif op == "lower=":
+                condition = pc.utf8_lower(field) == value
+            elif op == "between":
+                condition = (field >= value[0]) & (field <= value[1])
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            expression = condition if expression is None else expression & condition
+
+        columns = list(query.columns)
+        if query.order_by_desc:
+            table = dataset.to_table(columns=columns, filter=expression)
+            table = table.sort_by([(query.order_by_desc, "descending")]).slice(0, query.limit)
+        else:
+            # head() stops scanning as soon as enough matching rows are found.
+            table = dataset.head(query.limit, columns=columns, filter=expression)
+        return table.to_pylist()
+
+    def scan_table(self, table: str, columns) -> Iterator[dict]:
+        """Yields every row of a snapshot table as a dict of `columns`, one record batch at a time."""
+        for batch in self._dataset(table).to_batches(columns=list(columns)):
+            yield from batch.to_pylist()
+
+
+if __name__ == '__main__':
+    # To refresh the local snapshot from the backend directory:
+    #   python -m services.snapshot export --dir snapshots
+    # Then run the server with ENRICHMENT_BACKEND=snapshot.
+    from dotenv import load_dotenv
+    from google.cloud import bigquery
+
+    from services.analysis_service import BIGQUERY_TABLES
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manage local snapshots of the BigQuery enrichment tables.")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--dir", default=os.getenv("SNAPSHOT_DIR", "snapshots"))
+    parser.add_argument("--table", action="append", choices=sorted(BIGQUERY_TABLES), help="Only export this table (repeatable).")
+    args = parser.parse_args()
+
+    selected = {name: BIGQUERY_TABLES[name] for name in (args.table or BIGQUERY_TABLES)}
+    export_snapshot(bigquery.Client(project=os.getenv("GCP_PROJECT_ID")), args.dir, selected)
+    print(f"Snapshot written to {args.dir}")
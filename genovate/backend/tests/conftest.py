@@ -0,0 +1,20 @@
+import pytest
+
+from services.analysis_service import invalidate_enrichment_cache, invalidate_memo_cache
+from services.governor import BIGQUERY_GOVERNOR, GEMINI_GOVERNOR
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Keeps cached BigQuery results and memos from leaking between tests."""
+    invalidate_enrichment_cache()
+    invalidate_memo_cache()
+    yield
+    invalidate_enrichment_cache()
+    invalidate_memo_cache()
+
+@pytest.fixture(autouse=True)
+def close_circuits():
+    """Keeps a circuit opened by one test from rejecting calls in the next."""
+    for governor in (GEMINI_GOVERNOR, BIGQUERY_GOVERNOR):
+        governor.breaker.record_success()
+    yield
@@ -1,10 +1,23 @@
 
+import asyncio
+import concurrent.futures
+import time
+
 import pytest
 from unittest.mock import patch, MagicMock
-import pandas as pd
 
 # Import functions from the service
-from services.analysis_service import _extract_property_details, _fetch_bigquery_context
+from services.analysis_service import (
+    _extract_property_candidates,
+    _extract_property_details,
+    _fetch_bigquery_context,
+    _fetch_bigquery_context_async,
+    _serialize_rows,
+    get_analysis_memo,
+    get_batch_analysis_memos,
+    invalidate_enrichment_cache,
+    stream_analysis_memo,
+)
 
 # --- Tests for _extract_property_details ---
 
@@ -28,6 +41,19 @@ def test_extract_with_no_city():
     expected = {"state": "FL", "city": None, "zip": "33101", "property_type": "industrial", "sqft": 25000}
     assert _extract_property_details(content) == expected
 
+def test_extract_property_type_needs_whole_word():
+    content = "Landlord owns retail in Portland, OR. The officer on duty."
+    assert _extract_property_details(content)["property_type"] == "retail"
+    assert _extract_property_details("Two offices for lease.")["property_type"] == "office"
+
+def test_extract_lowercase_state_only_in_full_address():
+    # A lower-case state code is accepted when a city comes before it and a ZIP after it...
+    assert _extract_property_details("Austin, tx 78701")["state"] == "TX"
+    assert _extract_property_details("Austin, tx 78701")["city"] == "Austin"
+    # ...but not on its own, where it is as likely to be "in" or "or".
+    assert _extract_property_details("Offices in tx 78701")["state"] is None
+    assert _extract_property_details("Units in 12500 sf")["state"] is None
+
 # --- Tests for _fetch_bigquery_context ---
 
 @patch('services.analysis_service.bigquery.Client')
@@ -43,7 +69,7 @@ def test_fetch_bigquery_successful_fetch(mock_client):
     """Test a successful fetch from multiple tables."""
     # Mock the BigQuery client and its query method
     mock_query_job = MagicMock()
-    mock_query_job.to_dataframe.return_value = pd.DataFrame([{'state': 'CA', 'price': 500000}])
+    mock_query_job.result.return_value = [{'state': 'CA', 'price': 500000}]
     
     mock_instance = mock_client.return_value
     mock_instance.query.return_value = mock_query_job
@@ -55,15 +81,15 @@ def test_fetch_bigquery_successful_fetch(mock_client):
     mock_client.assert_called_once()
     # Assert that query was called multiple times (for each query in the function)
     assert mock_instance.query.call_count > 1
-    # Assert that the result contains parts of the mocked dataframe
+    # Assert that the result contains parts of the mocked rows
     assert '"state": "CA"' in result
     assert '"price": 500000' in result
 
 @patch('services.analysis_service.bigquery.Client')
 def test_fetch_bigquery_no_data_found(mock_client):
-    """Test that it returns a 'no data' message when queries return empty dataframes."""
+    """Test that it returns a 'no data' message when queries return no rows."""
     mock_query_job = MagicMock()
-    mock_query_job.to_dataframe.return_value = pd.DataFrame() # Empty dataframe
+    mock_query_job.result.return_value = [] # No rows
     
     mock_instance = mock_client.return_value
     mock_instance.query.return_value = mock_query_job
@@ -86,3 +112,242 @@ def test_fetch_bigquery_api_error(mock_client):
 
     assert "Error accessing BigQuery" in result
     assert "Permission Denied" in result
+
+def test_serialize_rows_handles_bigquery_types():
+    """Test that NUMERIC and DATE values are written as JSON numbers and ISO dates."""
+    import datetime
+    from decimal import Decimal
+    from google.cloud.bigquery.table import Row
+
+    rows = [Row(("CA", Decimal("1250000.50"), datetime.date(2025, 1, 31)), {"state": 0, "price": 1, "last_updated": 2})]
+    assert _serialize_rows(rows) == '[{"state": "CA", "price": 1250000.5, "last_updated": "2025-01-31"}]'
+    assert _serialize_rows([]) is None
+
+def _slow_query_job(delay, rows):
+    """Builds a mock query job whose result blocks for `delay` seconds, like QueryJob.result(timeout=...)."""
+    def result(timeout=None):
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise concurrent.futures.TimeoutError()
+        time.sleep(delay)
+        return rows
+    job = MagicMock()
+    job.result.side_effect = result
+    return job
+
+def test_fetch_bigquery_runs_queries_concurrently():
+    """Test that the enrichment queries overlap instead of running back to back."""
+    client = MagicMock()
+    client.query.side_effect = lambda *args, **kwargs: _slow_query_job(0.3, [{'state': 'CA'}])
+
+    start = time.perf_counter()
+    result = _fetch_bigquery_context({"state": "CA"}, client=client)
+    elapsed = time.perf_counter() - start
+
+    assert client.query.call_count == 4
+    assert elapsed < 0.9
+    assert "NFIP Financial Losses Data" in result
+
+def test_fetch_bigquery_returns_partial_results_on_timeout():
+    """Test that a slow query is reported as unavailable while the others are kept."""
+    def query(sql, job_config=None, timeout=None):
+        if 'realtor_data' in sql:
+            return _slow_query_job(1.0, [{'state': 'CA'}])
+        return _slow_query_job(0, [{'state': 'CA', 'amount_paid_on_claims': 10}])
+    client = MagicMock()
+    client.query.side_effect = query
+
+    result = asyncio.run(_fetch_bigquery_context_async({"state": "CA"}, client=client, timeout=0.2))
+
+    assert "Realtor Market Data:" not in result
+    assert "NFIP Financial Losses Data:" in result
+    assert "Realtor Market Data (timed out)" in result
+
+def test_fetch_bigquery_does_not_count_thread_wait_against_the_timeout():
+    """Test that queries queued behind a full pool still get their whole timeout once they start."""
+    client = MagicMock()
+    client.query.side_effect = lambda *args, **kwargs: _slow_query_job(0.2, [{'state': 'CA'}])
+
+    async def fetch_all():
+        return await asyncio.gather(*(
+            _fetch_bigquery_context_async({"state": state}, client=client, timeout=0.5)
+            for state in ("CA", "TX", "NY", "FL")
+        ))
+
+    with patch('services.analysis_service.BIGQUERY_EXECUTOR', concurrent.futures.ThreadPoolExecutor(max_workers=2)):
+        results = asyncio.run(fetch_all())
+
+    assert client.query.call_count == 16
+    assert all("timed out" not in result and "NFIP Financial Losses Data" in result for result in results)
+
+def test_fetch_bigquery_reuses_cached_state_data():
+    """Test that state-level risk lookups are served from the cache for a second city."""
+    mock_query_job = MagicMock()
+    mock_query_job.result.return_value = [{'state': 'CA'}]
+    client = MagicMock()
+    client.query.return_value = mock_query_job
+
+    _fetch_bigquery_context({"state": "CA", "city": "Anytown"}, client=client)
+    assert client.query.call_count == 4
+    _fetch_bigquery_context({"state": "CA", "city": "Anytown"}, client=client)
+    assert client.query.call_count == 4
+    result = _fetch_bigquery_context({"state": "CA", "city": "Othertown"}, client=client)
+
+    # Only the city-dependent realtor query runs again.
+    assert client.query.call_count == 5
+    assert "NFIP Financial Losses Data" in result
+
+    invalidate_enrichment_cache("nfip_losses_by_state")
+    _fetch_bigquery_context({"state": "CA", "city": "Anytown"}, client=client)
+    assert client.query.call_count == 6
+
+# --- Tests for stream_analysis_memo ---
+
+def test_stream_analysis_memo_yields_chain_chunks():
+    """Test that memo chunks are streamed from the chain with the enrichment context."""
+    chain = MagicMock()
+    async def astream(inputs, config=None):
+        assert "No location information" in inputs["bigquery_context"]
+        for chunk in ["## Memo", "", " body"]:
+            yield chunk
+    chain.astream.side_effect = astream
+
+    async def collect():
+        return [chunk async for chunk in stream_analysis_memo("A piece of property.", chain=chain)]
+
+    assert asyncio.run(collect()) == ["## Memo", " body"]
+
+def test_analysis_keeps_event_loop_responsive_during_cpu_work():
+    """Test that extraction and prompt budgeting run off the event loop."""
+    def slow_extract(file_content):
+        time.sleep(0.2)
+        return {}
+    def slow_budget(inputs, terms=None):
+        time.sleep(0.2)
+        return inputs, {}
+
+    async def main():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        task = asyncio.create_task(ticker())
+        memo = await get_analysis_memo("A piece of property.", chain=_counting_chain())
+        task.cancel()
+        return memo, ticks
+
+    with patch('services.analysis_service._extract_property_details', side_effect=slow_extract), \
+            patch('services.analysis_service.budget_prompt_inputs', side_effect=slow_budget):
+        memo, ticks = asyncio.run(main())
+
+    assert memo == "memo #1"
+    assert ticks >= 20
+
+# --- Tests for get_batch_analysis_memos ---
+
+def test_batch_analysis_deduplicates_lookups_and_bounds_llm_concurrency():
+    """Test that shared BigQuery lookups run once per batch and LLM calls respect the limit."""
+    mock_query_job = MagicMock()
+    mock_query_job.result.return_value = [{'state': 'CA'}]
+    client = MagicMock()
+    client.query.return_value = mock_query_job
+
+    in_flight = 0
+    max_in_flight = 0
+    async def ainvoke(inputs, config=None):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if "fail" in inputs["file_content"]:
+            raise RuntimeError("quota exceeded")
+        return f"memo for {inputs['file_content']}"
+    chain = MagicMock()
+    chain.ainvoke.side_effect = ainvoke
+
+    documents = ["Retail space, Anytown, CA."] * 5 + ["Office space, Austin, TX.", "Office space, fail, TX."]
+    finished = []
+    results = asyncio.run(get_batch_analysis_memos(
+        documents, enrichment_client=client, chain=chain, concurrency=2,
+        on_result=lambda index, result: finished.append(index),
+    ))
+
+    # 4 lookups for the CA documents plus the TX realtor/commercial/NFIP/SAFMRS lookups
+    # (the two TX documents share all but the city-specific realtor query).
+    assert client.query.call_count == 9
+    assert max_in_flight == 2
+    assert results[0] == {"memo": "memo for Retail space, Anytown, CA."}
+    assert results[-1] == {"error": "quota exceeded"}
+    assert sorted(finished) == list(range(7))
+
+# --- Tests for the memo cache ---
+
+def _counting_chain(delay=0):
+    chain = MagicMock()
+    async def ainvoke(inputs, config=None):
+        await asyncio.sleep(delay)
+        return f"memo #{chain.ainvoke.call_count}"
+    chain.ainvoke.side_effect = ainvoke
+    return chain
+
+def test_repeat_submission_is_served_from_memo_cache():
+    """Test that resubmitting the same document (modulo whitespace) does not call Gemini again."""
+    chain = _counting_chain()
+
+    first = asyncio.run(get_analysis_memo("A piece of property.\r\n", chain=chain))
+    second = asyncio.run(get_analysis_memo("  A piece of property.", chain=chain))
+    other = asyncio.run(get_analysis_memo("Another piece of property.", chain=chain))
+
+    assert first == second == "memo #1"
+    assert other == "memo #2"
+    assert chain.ainvoke.call_count == 2
+
+def test_concurrent_identical_requests_are_coalesced():
+    """Test that identical in-flight requests share a single Gemini call."""
+    chain = _counting_chain(delay=0.05)
+
+    async def submit_all():
+        return await asyncio.gather(*(get_analysis_memo("A piece of property.", chain=chain) for _ in range(5)))
+
+    assert asyncio.run(submit_all()) == ["memo #1"] * 5
+    assert chain.ainvoke.call_count == 1
+
+def test_streamed_memo_is_cached():
+    """Test that a fully streamed memo is returned from the cache on resubmission."""
+    chain = MagicMock()
+    async def astream(inputs, config=None):
+        for chunk in ["## Memo", " body"]:
+            yield chunk
+    chain.astream.side_effect = astream
+
+    async def collect():
+        return [chunk async for chunk in stream_analysis_memo("A piece of property.", chain=chain)]
+
+    assert asyncio.run(collect()) == ["## Memo", " body"]
+    assert asyncio.run(collect()) == ["## Memo body"]
+    assert asyncio.run(get_analysis_memo("A piece of property.", chain=chain)) == "## Memo body"
+    assert chain.astream.call_count == 1
+    chain.ainvoke.assert_not_called()
+
+def test_extract_ignores_lowercase_state_words():
+    content = "Located in downtown, or nearby. Retail space in Austin, TX 78701."
+    expected = {"state": "TX", "city": "Austin", "zip": "78701", "property_type": "retail", "sqft": None}
+    assert _extract_property_details(content) == expected
+
+def test_extract_ranks_complete_addresses_first():
+    content = (
+        "Sponsor HQ: NY. Subject property: 100 Pine St, San Francisco, CA 94111. "
+        "Comparable sale at Oakland, CA. 12500 sf multifamily."
+    )
+    details = _extract_property_details(content)
+    assert details == {"state": "CA", "city": "San Francisco", "zip": "94111", "property_type": "multifamily", "sqft": 12500}
+
+    candidates = _extract_property_candidates(content)
+    assert [(c["city"], c["state"], c["zip"]) for c in candidates] == [
+        ("San Francisco", "CA", "94111"),
+        ("Oakland", "CA", None),
+        (None, "NY", None),
+    ]
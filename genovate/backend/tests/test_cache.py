@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+
+from services.cache import MISSING, DiskCache, TieredCache, TTLCache
+
+# --- Tests for TTLCache ---
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=0.01)
+    cache.set("a", None)
+    assert cache.get("a") is None
+    time.sleep(0.02)
+    assert cache.get("a") is MISSING
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1, "evictions": 0, "expirations": 1}
+
+def test_ttl_cache_invalidates_by_prefix():
+    cache = TTLCache()
+    cache.set("realtor_data:CA", "x")
+    cache.set("nfip_losses_by_state:CA", "y")
+
+    assert cache.invalidate("realtor_data:") == 1
+    assert cache.get("realtor_data:CA") is MISSING
+    assert cache.get("nfip_losses_by_state:CA") == "y"
+
+# --- Tests for DiskCache and TieredCache ---
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = DiskCache(str(tmp_path), ttl=60)
+    TieredCache(TTLCache(), disk).set("nfip_losses_by_state:TX", '[{"state": "TX"}]')
+
+    # A fresh process only shares the disk tier.
+    cache = TieredCache(TTLCache(), DiskCache(str(tmp_path), ttl=60))
+    assert cache.get("nfip_losses_by_state:TX") == '[{"state": "TX"}]'
+    assert cache.get("nfip_losses_by_state:TX") == '[{"state": "TX"}]'
+    stats = cache.stats()
+    assert stats["disk"]["hits"] == 1
+    assert stats["memory"]["hits"] == 1
+
+def test_disk_cache_invalidates_by_prefix(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set("realtor_data:CA", "x")
+    cache.set("safmrs_revised:CA", "y")
+
+    assert cache.invalidate("safmrs_revised:") == 1
+    assert cache.get("safmrs_revised:CA") is MISSING
+    assert cache.get("realtor_data:CA") == "x"
+
+def test_disk_cache_deletes_expired_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=0.01)
+    for i in range(100):
+        cache.set(f"realtor_data:{i}", i)
+    time.sleep(0.02)
+
+    assert all(cache.get(f"realtor_data:{i}") is MISSING for i in range(100))
+    stats = cache.stats()
+    assert stats["entries"] == 0
+    assert stats["expirations"] == 100
+    assert stats["hits"] == 0
+
+def test_disk_cache_prunes_oldest_entries_past_max_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=3600, max_entries=10)
+    start = time.time() - 100
+    for i in range(25):
+        cache.set(f"realtor_data:{i}", i)
+        # Distinct mtimes, so the least recently written entries are pruned first.
+        os.utime(cache._path(f"realtor_data:{i}"), (start + i, start + i))
+
+    assert cache.stats()["entries"] <= 10
+    assert cache.get("realtor_data:24") == 24
+    assert cache.get("realtor_data:0") is MISSING
+
+def test_tiered_cache_async_access_uses_disk_tier(tmp_path):
+    cache = TieredCache(TTLCache(), DiskCache(str(tmp_path), ttl=60))
+
+    async def main():
+        await cache.aset("nfip_losses_by_state:TX", "x")
+        fresh = TieredCache(TTLCache(), DiskCache(str(tmp_path), ttl=60))
+        return await fresh.aget("nfip_losses_by_state:TX"), await fresh.aget("missing:key")
+
+    assert asyncio.run(main()) == ("x", MISSING)
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from services import analysis_service
+from services.analysis_service import (
+    _build_enrichment_queries,
+    _fetch_bigquery_context_async,
+    _fetch_bigquery_contexts_async,
+    refresh_comps_index,
+)
+from services.comps_index import ComparablesIndex, query_targets
+
+REALTOR_ROWS = [
+    {"city": "Anytown", "state": "CA", "price": 400000 + sqft * 100, "beds": 3, "baths": 2, "sqft": sqft}
+    for sqft in (900, 1200, 1500, 1800, 2400, 3000, 4500)
+] + [
+    {"city": "Othertown", "state": "CA", "price": 650000, "beds": 4, "baths": 3, "sqft": 1750},
+    {"city": "Anytown", "state": "CA", "price": 300000, "beds": 2, "baths": 1, "sqft": None},
+    {"city": "Austin", "state": "TX", "price": 500000, "beds": 3, "baths": 2, "sqft": 1800},
+]
+COMMERCIAL_ROWS = [
+    {"sale_price": 2_000_000, "city": "Anytown", "state": "CA", "property_type": "Office", "year_built": 1985},
+    {"sale_price": 3_500_000, "city": "Anytown", "state": "CA", "property_type": "Office", "year_built": 2015},
+    {"sale_price": 1_200_000, "city": "Othertown", "state": "CA", "property_type": "Retail", "year_built": 2020},
+]
+
+@pytest.fixture
+def index():
+    index = ComparablesIndex()
+    index.replace("realtor_data", REALTOR_ROWS)
+    index.replace("commercial_real_estate", COMMERCIAL_ROWS)
+    return index
+
+# --- Tests for ComparablesIndex ---
+
+def test_nearest_returns_closest_sizes_first(index):
+    comps = index.nearest("realtor_data", "CA", city="Anytown", sqft=1700, k=3)
+    assert [comp["sqft"] for comp in comps] == [1800, 1500, 2400]
+    assert set(comps[0]) == {"city", "state", "price", "beds", "baths", "sqft"}
+
+def test_nearest_tops_up_from_the_state(index):
+    comps = index.nearest("realtor_data", "CA", city="Anytown", sqft=1700, k=8)
+    assert len(comps) == 8
+    # All seven sized Anytown comps come first; the state fills the last place.
+    assert [comp["city"] for comp in comps[:7]] == ["Anytown"] * 7
+    assert comps[7]["city"] == "Othertown"
+
+def test_nearest_without_size_prefers_newest(index):
+    comps = index.nearest("commercial_real_estate", "CA", property_type="office", k=5)
+    assert [comp["year_built"] for comp in comps] == [2015, 1985]
+    assert index.nearest("commercial_real_estate", "TX", k=5) == []
+
+def test_unloaded_table_raises():
+    with pytest.raises(LookupError):
+        ComparablesIndex().nearest("realtor_data", "CA")
+
+def test_query_targets_use_exact_subject_sqft():
+    realtor_query = _build_enrichment_queries({"state": "CA", "city": "Anytown", "sqft": 1700})[0]
+    targets = query_targets(realtor_query)
+    assert targets == {"k": 5, "state": "CA", "city": "Anytown", "sqft": 1700}
+    # The cache key still uses the banded window, so nearby sizes share it.
+    assert realtor_query.cache_key == _build_enrichment_queries({"state": "CA", "city": "Anytown", "sqft": 1710})[0].cache_key
+
+# --- Tests for the enrichment integration ---
+
+def test_loaded_index_answers_comps_queries(index, monkeypatch):
+    monkeypatch.setattr(analysis_service, "COMPS_INDEX", index)
+    job = MagicMock()
+    job.result.return_value = [{"state": "CA", "amount_paid_on_claims": 10}]
+    client = MagicMock()
+    client.query.return_value = job
+
+    result = asyncio.run(_fetch_bigquery_context_async({"state": "CA", "city": "Anytown", "sqft": 1700}, client=client))
+
+    # Only the NFIP and SAFMRS lookups reach BigQuery.
+    assert client.query.call_count == 2
+    realtor = json.loads(result.split("Realtor Market Data:\n")[1].split("\n\n")[0])
+    assert [comp["sqft"] for comp in realtor] == [1800, 1500, 2400, 1200, 3000]
+
+def test_indexed_comps_use_each_subjects_exact_sqft(index, monkeypatch):
+    """Test that documents in the same sqft band still get comps nearest their own size."""
+    monkeypatch.setattr(analysis_service, "COMPS_INDEX", index)
+    client = MagicMock()
+    client.query.return_value.result.return_value = []
+
+    small, large = asyncio.run(_fetch_bigquery_contexts_async(
+        [{"state": "CA", "city": "Anytown", "sqft": 1620}, {"state": "CA", "city": "Anytown", "sqft": 1770}],
+        client=client,
+    ))
+
+    nearest = [json.loads(context.split("Realtor Market Data:\n")[1].split("\n\n")[0])[0]["sqft"] for context in (small, large)]
+    assert nearest == [1500, 1800]
+
+def test_refresh_comps_index_keeps_previous_index_on_failure(monkeypatch):
+    index = ComparablesIndex()
+    monkeypatch.setattr(analysis_service, "COMPS_INDEX", index)
+
+    def query(sql, job_config=None):
+        job = MagicMock()
+        if "realtor_data" in sql:
+            job.result.return_value = REALTOR_ROWS
+        else:
+            job.result.side_effect = RuntimeError("table unavailable")
+        return job
+    client = MagicMock()
+    client.query.side_effect = query
+
+    stats = asyncio.run(refresh_comps_index(client))
+
+    assert stats["realtor_data"]["rows"] == len(REALTOR_ROWS)
+    assert "commercial_real_estate" not in stats
@@ -0,0 +1,87 @@
+import json
+
+from services.context_budget import (
+    budget_prompt_inputs,
+    compact_bigquery_context,
+    count_tokens,
+    encode_rows_compact,
+    select_relevant_chunks,
+    strip_boilerplate,
+)
+
+def test_strip_boilerplate_removes_page_furniture():
+    page = "ACME Capital - Confidential\nNOI: $1,200,000\n\n\n   Occupancy   94%  \nPage 1 of 3\n-----\n"
+    text = page * 3
+    stripped = strip_boilerplate(text)
+
+    assert "Confidential" not in stripped
+    assert "Page 1" not in stripped
+    assert "-----" not in stripped
+    assert stripped.count("NOI: $1,200,000") == 3
+    assert "Occupancy 94%" in stripped
+    assert "\n\n\n" not in stripped
+
+def test_strip_boilerplate_keeps_values_on_their_own_lines():
+    text = "Year Built\n1998\nUnits\n120\nPurchase Price\n12500000\nPage 3 of 9\n- 4 -"
+
+    assert strip_boilerplate(text) == "Year Built\n1998\nUnits\n120\nPurchase Price\n12500000"
+
+def test_strip_boilerplate_keeps_repeated_table_cells():
+    rows = "Suite 100\nRetail\nVacant\nSuite 200\nRetail\nVacant\nSuite 300\nRetail\nVacant\nSuite 400\nOffice"
+    text = f"Rent Roll\n{rows}\n\fRent Roll\nNotes\n\fRent Roll\nAppendix"
+    stripped = strip_boilerplate(text)
+
+    assert stripped.count("Retail") == 3
+    assert stripped.count("Vacant") == 3
+    assert "Rent Roll" not in stripped
+
+def test_select_relevant_chunks_keeps_title_and_relevant_paragraphs():
+    title = "Offering Memorandum: Pine Street Apartments"
+    relevant = "Rent roll: 48 units, occupancy 96%, NOI $1,245,000, cap rate 5.5% in San Francisco, CA."
+    filler = "The sponsor has a long history of community involvement and charitable giving. " * 20
+    text = "\n\n".join([title, filler, relevant, filler])
+
+    selected = select_relevant_chunks(text, budget_tokens=count_tokens(title) + count_tokens(relevant) + 10, terms=["San Francisco"])
+
+    assert selected == f"{title}\n\n[...]\n\n{relevant}\n\n[...]"
+
+def test_select_relevant_chunks_leaves_small_documents_alone():
+    assert select_relevant_chunks("Office in Austin, TX.", budget_tokens=100) == "Office in Austin, TX."
+
+def test_compact_bigquery_context_encodes_rows_as_tables():
+    rows = [{"city": "Anytown", "state": "CA", "price": 500000.0}, {"city": "Anytown", "state": "CA", "price": None}]
+    context = f"Realtor Market Data:\n{json.dumps(rows)}\n\nUnavailable BigQuery Sources:\nInternal SAFMRS Risk Data (timed out)"
+
+    compacted = compact_bigquery_context(context, budget_tokens=1000)
+
+    assert compacted == (
+        "Realtor Market Data:\ncity | state | price\nAnytown | CA | 500000\nAnytown | CA | \n\n"
+        "Unavailable BigQuery Sources:\nInternal SAFMRS Risk Data (timed out)"
+    )
+    assert count_tokens(compacted) < count_tokens(context)
+
+def test_encode_rows_compact_handles_heterogeneous_rows():
+    assert encode_rows_compact([{"a": 1}, {"b": "x|y"}]) == "a | b\n1 | \n | x/y"
+
+def test_budget_prompt_inputs_leaves_documents_within_budget_alone():
+    inputs = {"file_content": "Units\n120\n\n\nPage 1", "bigquery_context": ""}
+
+    budgeted, report = budget_prompt_inputs(inputs, document_budget=100, context_budget=100)
+
+    assert budgeted["file_content"] == inputs["file_content"]
+    assert report["file_content"]["saved_tokens"] == 0
+
+def test_budget_prompt_inputs_reports_savings():
+    inputs = {
+        "file_content": ("Header\n" + "Lease expires 2030, rent $30/sf.\n\n" * 400),
+        "bigquery_context": "NFIP Financial Losses Data:\n" + json.dumps([{"state": "CA", "amount_paid_on_claims": 10}]),
+    }
+
+    budgeted, report = budget_prompt_inputs(inputs, document_budget=200, context_budget=100)
+
+    assert count_tokens(budgeted["file_content"]) <= 200
+    assert report["file_content"]["saved_tokens"] > 0
+    assert report["bigquery_context"]["saved_tokens"] == (
+        report["bigquery_context"]["original_tokens"] - report["bigquery_context"]["final_tokens"]
+    )
+    assert budgeted["bigquery_context"] == "NFIP Financial Losses Data:\nstate | amount_paid_on_claims\nCA | 10"
@@ -0,0 +1,59 @@
+import hashlib
+import importlib.util
+import os
+import zipfile
+
+import pytest
+
+# download.py lives in the project root, next to the frontend, not in the backend package.
+_spec = importlib.util.spec_from_file_location(
+    "download", os.path.join(os.path.dirname(__file__), "..", "..", "download.py")
+)
+download = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(download)
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def _sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write("README.md", "# Project\n" * 50)
+    _write("backend/main.py", "print('hello')\n" * 50)
+    _write("backend/.env", "API_KEY=secret\n")
+    _write("backend/__pycache__/main.cpython-311.pyc", "bytecode")
+    _write("backend/tests/.pytest_cache/v/cache", "{}")
+    return tmp_path
+
+def _package(capsys):
+    assert download.zip_project("out.zip", ["README.md", "backend/"])
+    return capsys.readouterr().out
+
+def test_package_is_valid_and_excludes_secrets_and_caches(project, capsys):
+    _package(capsys)
+
+    with zipfile.ZipFile("out.zip") as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["README.md", "backend/main.py"]
+        assert archive.read("backend/main.py") == b"print('hello')\n" * 50
+
+def test_package_is_reproducible_and_only_recompresses_changed_files(project, capsys):
+    assert "2 files, 2 recompressed, 0 reused" in _package(capsys)
+    first = _sha256("out.zip")
+
+    # A fresh cache must produce the same bytes, and a warm one must reuse everything.
+    os.rename(download.CACHE_DIR, "old_cache")
+    assert "2 files, 2 recompressed, 0 reused" in _package(capsys)
+    assert _sha256("out.zip") == first
+    assert "2 files, 0 recompressed, 2 reused" in _package(capsys)
+    assert _sha256("out.zip") == first
+
+    _write("backend/main.py", "print('changed')\n")
+    assert "2 files, 1 recompressed, 1 reused" in _package(capsys)
+    assert _sha256("out.zip") != first
@@ -0,0 +1,62 @@
+import json
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from google.cloud.bigquery.table import Row
+
+from services.analysis_service import _serialize_rows
+
+# One request runs four enrichment queries returning at most five rows each.
+COLUMNS = {"city": 0, "state": 1, "price": 2, "beds": 3, "baths": 4, "sqft": 5}
+QUERY_ROWS = [
+    [Row(("Anytown", "CA", 500000.0 + i, 3, 2.0, 1800 + i), COLUMNS) for i in range(5)],
+    [Row(("Anytown", "CA", 2500000.0, "office", 1998, None, None), {**COLUMNS, "year_built": 6})] * 5,
+    [Row(("CA", 123456789.0), {"state": 0, "amount_paid_on_claims": 1})],
+    [Row(("CA", "Moderate flood exposure", "2025-01-31"), {"state": 0, "risk_summary": 1, "last_updated": 2})],
+]
+
+
+def _serialize_request_with_rows():
+    return [_serialize_rows(rows) for rows in QUERY_ROWS]
+
+
+def _serialize_request_with_dataframes():
+    """The previous path: RowIterator.to_dataframe() (Arrow -> pandas) and DataFrame.to_json."""
+    pa = pytest.importorskip("pyarrow")
+    results = []
+    for rows in QUERY_ROWS:
+        frame = pa.Table.from_pylist([dict(row.items()) for row in rows]).to_pandas()
+        results.append(None if frame.empty else frame.to_json(orient="records"))
+    return results
+
+
+def _peak_allocated(fn) -> int:
+    fn()  # Warm up imports and caches so only per-request allocations are measured.
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_benchmark_enrichment_rows(benchmark):
+    results = benchmark(_serialize_request_with_rows)
+    assert json.loads(results[0])[0]["city"] == "Anytown"
+
+
+def test_benchmark_enrichment_dataframes(benchmark):
+    pytest.importorskip("pandas")
+    results = benchmark(_serialize_request_with_dataframes)
+    assert json.loads(results[0])[0]["city"] == "Anytown"
+
+
+def test_row_serialization_allocates_less_than_dataframes():
+    pytest.importorskip("pandas")
+    rows_peak = _peak_allocated(_serialize_request_with_rows)
+    dataframes_peak = _peak_allocated(_serialize_request_with_dataframes)
+    print(f"Peak allocation per request: rows {rows_peak} bytes, dataframes {dataframes_peak} bytes")
+    assert rows_peak < dataframes_peak
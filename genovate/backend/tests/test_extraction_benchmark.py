@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from services.analysis_service import _extract_property_details
+
+# Paragraphs typical of an offering memorandum, with plenty of numbers, capitalized
+# words and upper-case abbreviations that are not addresses.
+FILLER = (
+    "The Property Offers Investors A Stabilized Income Stream With In-Place Rents Below Market. "
+    "NOI for 2024 was $1,245,000 on gross revenue of $2,010,500, a 61.9% margin. "
+    "Tenant Roster, Lease Expirations And Renewal Options Are Summarized In Exhibit B. "
+    "CAPEX reserves of $250 per unit AND/OR replacement reserves are held in escrow. "
+    "Occupancy averaged 94.2% over 36 months; the 12345 loan number is for reference only.\n"
+)
+SUBJECT = "Subject: 100 Pine St, San Francisco, CA 94111. A 48,500 sqft multifamily asset.\n"
+
+
+def _synthetic_document(size: int) -> str:
+    """Builds a document of roughly `size` characters with the subject address in the middle."""
+    repeats = max(1, size // len(FILLER))
+    half = FILLER * (repeats // 2)
+    return half + SUBJECT + half
+
+
+@pytest.mark.parametrize("size", [10_000, 100_000, 1_000_000])
+def test_benchmark_extract_offering_memo(benchmark, size):
+    document = _synthetic_document(size)
+    details = benchmark.pedantic(_extract_property_details, args=(document,), rounds=5, iterations=1)
+    assert details == {"state": "CA", "city": "San Francisco", "zip": "94111", "property_type": "multifamily", "sqft": 48500}
+
+
+@pytest.mark.parametrize("size", [10_000, 100_000])
+def test_benchmark_extract_long_text_without_address(benchmark, size):
+    """Long runs of letters and spaces with a trailing state made the old city regex backtrack quadratically."""
+    document = "lorem ipsum dolor sit amet " * (size // 27) + "CA"
+    details = benchmark.pedantic(_extract_property_details, args=(document,), rounds=5, iterations=1)
+    assert details["state"] == "CA"
+    assert details["city"] is None
@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+from google.api_core.exceptions import NotFound, ResourceExhausted
+
+from services.governor import CircuitBreaker, CircuitOpenError, Governor, TokenBucket, is_retryable
+
+def _governor(**kwargs):
+    options = {"rate": 1000, "burst": 1000, "max_concurrency": 10, "retry_base": 0.001, "retry_max": 0.01}
+    options.update(kwargs)
+    return Governor("test", **options)
+
+# --- Tests for TokenBucket ---
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def main():
+        start = time.monotonic()
+        waited = [await bucket.acquire() for _ in range(4)]
+        return time.monotonic() - start, waited
+
+    elapsed, waited = asyncio.run(main())
+    # The first token is available immediately; the next three take 1/50s each.
+    assert elapsed >= 0.05
+    assert waited == [False, True, True, True]
+
+# --- Tests for Governor ---
+
+def test_retryable_errors_are_retried():
+    governor = _governor()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ResourceExhausted("Quota exceeded")
+        return "ok"
+
+    assert asyncio.run(governor.call(flaky)) == "ok"
+    assert len(attempts) == 3
+    assert governor.stats()["retries"] == 2
+
+def test_non_retryable_errors_are_not_retried():
+    governor = _governor()
+    attempts = []
+
+    async def missing():
+        attempts.append(1)
+        raise NotFound("Table not found")
+
+    with pytest.raises(NotFound):
+        asyncio.run(governor.call(missing))
+    assert len(attempts) == 1
+    assert governor.breaker.state == "closed"
+
+def test_concurrency_is_bounded():
+    governor = _governor(max_concurrency=2)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        peak = max(peak, governor.in_flight)
+        await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(governor.call(work) for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert governor.stats()["throttled"] >= 4
+
+def test_circuit_opens_after_repeated_failures_and_recovers():
+    governor = _governor(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.05))
+
+    async def overloaded():
+        raise ResourceExhausted("Quota exceeded")
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(ResourceExhausted):
+                await governor.call(overloaded)
+        with pytest.raises(CircuitOpenError):
+            await governor.call(ok)
+        await asyncio.sleep(0.06)
+        # Half-open: one trial call is let through and closes the circuit.
+        return await governor.call(ok)
+
+    assert asyncio.run(main()) == "ok"
+    assert governor.breaker.state == "closed"
+    assert governor.stats()["rejected"] == 1
+
+def _half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    return breaker
+
+def test_trial_cancelled_while_waiting_does_not_keep_circuit_open():
+    governor = _governor(max_concurrency=1, breaker=_half_open_breaker())
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        # Hold the only slot so the trial call waits for it, then cancel the trial.
+        semaphore = governor._semaphore()
+        await semaphore.acquire()
+        trial = asyncio.ensure_future(governor.call(ok))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        semaphore.release()
+        return await governor.call(ok)
+
+    assert asyncio.run(main()) == "ok"
+    assert governor.breaker.state == "closed"
+    assert governor.stats()["waiting"] == 0
+
+def test_trial_stream_closed_early_does_not_keep_circuit_open():
+    governor = _governor(breaker=_half_open_breaker())
+
+    async def stream():
+        async with governor.slot():
+            for chunk in ("a", "b", "c"):
+                yield chunk
+
+    async def main():
+        chunks = stream()
+        assert await chunks.__anext__() == "a"
+        # A client disconnecting closes the stream with GeneratorExit.
+        await chunks.aclose()
+        async with governor.slot():
+            pass
+
+    asyncio.run(main())
+    assert governor.breaker.state == "closed"
+    assert governor.stats()["in_flight"] == 0
+
+def test_is_retryable_recognizes_bigquery_rate_limits():
+    from google.api_core.exceptions import Forbidden
+    assert is_retryable(Forbidden("Exceeded rate limits: too many concurrent queries. reason: rateLimitExceeded"))
+    assert not is_retryable(Forbidden("Access Denied"))
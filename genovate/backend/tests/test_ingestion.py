@@ -0,0 +1,67 @@
+import asyncio
+import io
+
+import pytest
+from starlette.datastructures import Headers, UploadFile
+
+import services.ingestion as ingestion
+from services.ingestion import UploadError, extract_text_from_upload
+
+def _upload(data: bytes, filename: str, content_type: str = "") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename, headers=Headers({"content-type": content_type}))
+
+def _minimal_pdf(text: str) -> bytes:
+    """Builds a one-page PDF that draws `text`, with a valid cross-reference table."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Forces multi-byte characters and CSV rows to straddle read boundaries."""
+    monkeypatch.setattr(ingestion, "UPLOAD_CHUNK_BYTES", 7)
+
+def test_text_upload_is_decoded_incrementally(small_chunks):
+    text = "Café building, Anytown, CA 90210 — 50,000 sqft office.\n" * 3
+    result = asyncio.run(extract_text_from_upload(_upload(text.encode("utf-8"), "memo.txt", "text/plain")))
+    assert result == text
+
+def test_csv_rent_roll_is_converted_to_rows(small_chunks):
+    data = b'Unit,Tenant,Rent\n101,"Smith, J.",1500\n102,"Multi\nline note",1650\n\n103,Vacant,\n'
+    result = asyncio.run(extract_text_from_upload(_upload(data, "rent_roll.csv")))
+    assert result == "Unit | Tenant | Rent\n101 | Smith, J. | 1500\n102 | Multi\nline note | 1650\n103 | Vacant | "
+
+def test_pdf_text_is_extracted():
+    result = asyncio.run(extract_text_from_upload(_upload(_minimal_pdf("Office in Austin, TX 78701"), "om.pdf", "application/pdf")))
+    assert "Office in Austin, TX 78701" in result
+
+def test_extracted_text_is_capped(monkeypatch):
+    monkeypatch.setattr(ingestion, "MAX_EXTRACTED_CHARS", 10)
+    result = asyncio.run(extract_text_from_upload(_upload(b"x" * 1000, "memo.txt")))
+    assert result == "x" * 10
+
+def test_oversized_upload_is_rejected(monkeypatch):
+    monkeypatch.setattr(ingestion, "MAX_UPLOAD_BYTES", 100)
+    with pytest.raises(UploadError) as error:
+        asyncio.run(extract_text_from_upload(_upload(b"x" * 1000, "memo.txt")))
+    assert error.value.status_code == 413
+
+def test_unsupported_upload_is_rejected():
+    with pytest.raises(UploadError) as error:
+        asyncio.run(extract_text_from_upload(_upload(b"\x00", "photo.png", "image/png")))
+    assert error.value.status_code == 415
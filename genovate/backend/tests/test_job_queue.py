@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from services.job_queue import JobQueue, QueueFullError
+
+async def _wait_until_finished(job_queue, job_id):
+    for _ in range(200):
+        job = await job_queue.get(job_id)
+        if job.status in ("completed", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+# --- Tests for JobQueue ---
+
+def test_jobs_run_in_priority_order():
+    order = []
+
+    async def handler(file_content):
+        order.append(file_content)
+        return f"memo for {file_content}"
+
+    async def main():
+        job_queue = JobQueue(handler, workers=1)
+        await job_queue.start()
+        # Jobs are submitted before the single worker gets a chance to run.
+        low = await job_queue.submit("low", priority=0)
+        high = await job_queue.submit("high", priority=9)
+        normal = await job_queue.submit("normal", priority=5)
+        for job in (low, high, normal):
+            await _wait_until_finished(job_queue, job.id)
+        await job_queue.stop()
+        return await job_queue.get(high.id)
+
+    high = asyncio.run(main())
+    assert order == ["high", "normal", "low"]
+    assert high.to_dict()["memo"] == "memo for high"
+
+def test_full_queue_rejects_jobs():
+    async def handler(file_content):
+        await asyncio.sleep(10)
+
+    async def main():
+        job_queue = JobQueue(handler, workers=1, max_size=2)
+        await job_queue.start()
+        await job_queue.submit("a")
+        await job_queue.submit("b")
+        with pytest.raises(QueueFullError):
+            await job_queue.submit("c")
+        stats = job_queue.stats()
+        await job_queue.stop()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["queued"] == 2
+    assert stats["rejected"] == 1
+
+def test_full_sqlite_queue_rejects_concurrent_submits(tmp_path):
+    async def handler(file_content):
+        return file_content
+
+    async def main():
+        job_queue = JobQueue(handler, workers=0, max_size=2, db_path=str(tmp_path / "jobs.db"))
+        await job_queue.start()
+        outcomes = await asyncio.gather(*(job_queue.submit(str(i)) for i in range(6)), return_exceptions=True)
+        stats = job_queue.stats()
+        await job_queue.stop()
+        return outcomes, stats
+
+    outcomes, stats = asyncio.run(main())
+    assert sum(isinstance(outcome, QueueFullError) for outcome in outcomes) == 4
+    assert stats["queued"] == 2
+    assert stats["rejected"] == 4
+
+def test_failed_job_reports_error():
+    async def handler(file_content):
+        raise RuntimeError("Gemini unavailable")
+
+    async def main():
+        job_queue = JobQueue(handler, workers=1)
+        await job_queue.start()
+        job = await job_queue.submit("doc")
+        job = await _wait_until_finished(job_queue, job.id)
+        await job_queue.stop()
+        return job.to_dict()
+
+    result = asyncio.run(main())
+    assert result["status"] == "failed"
+    assert "Gemini unavailable" in result["error"]
+
+def test_sqlite_queue_recovers_unfinished_jobs(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+
+    async def never_finishes(file_content):
+        await asyncio.sleep(10)
+
+    async def echo(file_content):
+        return f"memo for {file_content}"
+
+    async def first_process():
+        job_queue = JobQueue(never_finishes, workers=1, db_path=db_path)
+        await job_queue.start()
+        running = await job_queue.submit("running")
+        queued = await job_queue.submit("queued")
+        await asyncio.sleep(0.05)
+        await job_queue.stop()
+        return running.id, queued.id
+
+    async def second_process(job_ids):
+        job_queue = JobQueue(echo, workers=1, db_path=db_path)
+        await job_queue.start()
+        jobs = [await _wait_until_finished(job_queue, job_id) for job_id in job_ids]
+        await job_queue.stop()
+        return jobs
+
+    job_ids = asyncio.run(first_process())
+    jobs = asyncio.run(second_process(job_ids))
+    assert [job.memo for job in jobs] == ["memo for running", "memo for queued"]
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from loadtest.fakes import LatencyProfile
+from loadtest.run import _percentile, compare_to_baseline, run_load_test
+
+FAST = LatencyProfile(median_seconds=0.001, sigma=0, seed=1)
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("API_KEY", "test-key")
+    monkeypatch.setenv("GCP_PROJECT_ID", "test-project")
+
+# --- Smoke tests for the load-test harness ---
+
+def test_load_test_runs_against_stand_ins(env):
+    results = asyncio.run(run_load_test([1, 4], 8, FAST, FAST))
+
+    assert [level["concurrency"] for level in results] == [1, 4]
+    for level in results:
+        assert level["requests"] == 8
+        assert level["errors"] == 0
+        assert level["requests_per_second"] > 0
+        assert level["p50_ms"] <= level["p95_ms"] <= level["p99_ms"]
+
+def test_load_test_streaming_endpoint(env):
+    results = asyncio.run(run_load_test([2], 4, FAST, FAST, endpoint="/analyze/stream"))
+    assert results[0]["errors"] == 0
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 99) == 99.0
+    assert _percentile([], 95) == 0.0
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = [{"concurrency": 8, "p95_ms": 100.0, "requests_per_second": 50.0}]
+    assert compare_to_baseline([{"concurrency": 8, "p95_ms": 110.0, "requests_per_second": 48.0}], baseline) == []
+    regressions = compare_to_baseline([{"concurrency": 8, "p95_ms": 150.0, "requests_per_second": 30.0}], baseline)
+    assert len(regressions) == 2
@@ -0,0 +1,299 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+
+import main
+from services.batch_jobs import BatchJobStore
+from services.clients import create_service_clients, close_service_clients
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("API_KEY", "test-key")
+    monkeypatch.setenv("GCP_PROJECT_ID", "test-project")
+
+# --- Tests for the shared client lifespan ---
+
+@patch('main.close_service_clients')
+@patch('main.create_service_clients', new_callable=AsyncMock)
+@patch('main.get_analysis_memo', new_callable=AsyncMock)
+def test_clients_created_once_and_shared(mock_memo, mock_create, mock_close, env):
+    """Test that one set of clients is created at startup and injected into every request."""
+    clients = main.ServiceClients(bigquery_client=MagicMock(), analysis_chain=MagicMock())
+    mock_create.return_value = clients
+    mock_memo.return_value = "## Memo"
+
+    with TestClient(main.app) as client:
+        for _ in range(2):
+            response = client.post("/analyze", json={"file_content": "Office in Austin, TX"})
+            assert response.status_code == 200
+            assert response.json() == {"memo": "## Memo"}
+
+    mock_create.assert_awaited_once()
+    assert mock_memo.await_count == 2
+    for call in mock_memo.await_args_list:
+        assert call.kwargs["enrichment_client"] is clients.bigquery_client
+        assert call.kwargs["chain"] is clients.analysis_chain
+    mock_close.assert_called_once_with(clients)
+
+@patch('services.clients.ChatGoogleGenerativeAI')
+@patch('services.clients.bigquery.Client')
+def test_create_service_clients_warms_up_bigquery(mock_bq_client, mock_llm):
+    """Test that startup creates the clients, enlarges the connection pool and runs a warm-up query."""
+    clients = asyncio.run(create_service_clients())
+
+    mock_bq_client.assert_called_once()
+    mock_llm.assert_called_once()
+    instance = mock_bq_client.return_value
+    instance._http.mount.assert_called_once()
+    instance.query.assert_called_once_with("SELECT 1")
+
+    close_service_clients(clients)
+    instance.close.assert_called_once()
+    assert clients.bigquery_client is None
+
+@patch('services.clients.ChatGoogleGenerativeAI')
+@patch('services.clients.bigquery.Client', side_effect=Exception("no credentials"))
+def test_create_service_clients_tolerates_missing_credentials(mock_bq_client, mock_llm):
+    """Test that a BigQuery client failure at startup does not prevent the server from starting."""
+    clients = asyncio.run(create_service_clients())
+
+    assert clients.bigquery_client is None
+    assert clients.analysis_chain is not None
+
+# --- Tests for /analyze/stream ---
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.stream_analysis_memo')
+def test_analyze_stream_emits_memo_chunks(mock_stream, mock_create, env):
+    """Test that memo chunks are sent as SSE events followed by a done event."""
+    async def chunks(*args, **kwargs):
+        yield "## Executive Summary\n"
+        yield "Strong deal."
+    mock_stream.side_effect = chunks
+
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/stream", json={"file_content": "Office in Austin, TX"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [e for e in response.text.split("\n\n") if e]
+    assert events == [
+        'data: {"delta": "## Executive Summary\\n"}',
+        'data: {"delta": "Strong deal."}',
+        'event: done\ndata: {}',
+    ]
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.stream_analysis_memo')
+def test_analyze_stream_reports_errors_in_band(mock_stream, mock_create, env):
+    """Test that a failure after streaming has started is sent as an error event."""
+    async def chunks(*args, **kwargs):
+        yield "## Executive"
+        raise RuntimeError("quota exceeded")
+    mock_stream.side_effect = chunks
+
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/stream", json={"file_content": "Office in Austin, TX"})
+
+    assert response.text.endswith('event: error\ndata: {"detail": "An internal error occurred during analysis: quota exceeded"}\n\n')
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+def test_analyze_stream_rejects_empty_content(mock_create, env):
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/stream", json={"file_content": "   "})
+
+    assert response.status_code == 400
+
+# --- Tests for /analyze/batch ---
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.get_batch_analysis_memos', new_callable=AsyncMock)
+def test_analyze_batch_returns_pollable_job(mock_batch, mock_create, env):
+    """Test that a batch returns a job id and the per-document results can be polled."""
+    async def run_batch(documents, on_result=None, **kwargs):
+        on_result(1, {"error": "quota exceeded"})
+        on_result(0, {"memo": "## Memo"})
+    mock_batch.side_effect = run_batch
+
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/batch", json={"documents": [
+            {"id": "prop-a", "file_content": "Office in Austin, TX"},
+            {"file_content": "Retail in Miami, FL"},
+        ]})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        status = client.get(f"/analyze/batch/{job_id}").json()
+        for _ in range(50):
+            if status["status"] == "completed":
+                break
+            status = client.get(f"/analyze/batch/{job_id}").json()
+
+    assert status["status"] == "completed"
+    assert status["completed"] == 1 and status["failed"] == 1
+    assert status["items"] == [
+        {"id": "prop-a", "status": "completed", "memo": "## Memo"},
+        {"id": "1", "status": "failed", "error": "quota exceeded"},
+    ]
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.get_batch_analysis_memos', new_callable=AsyncMock)
+def test_analyze_batch_rejects_past_running_limit_and_cancels_at_shutdown(mock_batch, mock_create, env):
+    async def run_forever(documents, on_result=None, **kwargs):
+        await asyncio.sleep(60)
+    mock_batch.side_effect = run_forever
+    store = BatchJobStore(max_running=1)
+    documents = {"documents": [{"file_content": "Office in Austin, TX"}]}
+
+    with patch('main.batch_jobs', store), TestClient(main.app) as client:
+        first = client.post("/analyze/batch", json=documents)
+        second = client.post("/analyze/batch", json=documents)
+        job = store.get(first.json()["job_id"])
+
+    assert first.status_code == 202
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "30"
+    assert store.rejected == 1
+    # The lifespan teardown cancelled the running batch.
+    assert job.task.done()
+    assert job.status == "failed" and job.finished_at is not None
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+def test_analyze_batch_validation(mock_create, env):
+    with TestClient(main.app) as client:
+        assert client.post("/analyze/batch", json={"documents": []}).status_code == 400
+        response = client.post("/analyze/batch", json={"documents": [{"id": "a", "file_content": " "}]})
+        assert response.status_code == 400
+        assert "a" in response.json()["detail"]
+        assert client.get("/analyze/batch/unknown").status_code == 404
+
+# --- Tests for /analyze/upload ---
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.get_analysis_memo', new_callable=AsyncMock, return_value="## Memo")
+def test_analyze_upload_feeds_extracted_text_to_pipeline(mock_memo, mock_create, env):
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/analyze/upload",
+            files={"file": ("rent_roll.csv", b"Unit,Rent\n101,1500\n", "text/csv")},
+        )
+
+    assert response.status_code == 200
+    assert response.json() == {"memo": "## Memo"}
+    assert mock_memo.await_args.args[0] == "Unit | Rent\n101 | 1500"
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+def test_analyze_upload_rejects_unsupported_files(mock_create, env):
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/upload", files={"file": ("photo.png", b"\x89PNG", "image/png")})
+
+    assert response.status_code == 415
+
+# --- Tests for /metrics ---
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+def test_metrics_endpoint_exposes_stage_histograms(mock_create, env):
+    with TestClient(main.app) as client:
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "analysis_stage_duration_seconds" in response.text
+
+# --- Tests for /analyze?mode=job ---
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.get_analysis_memo', new_callable=AsyncMock, return_value="## Memo")
+def test_analyze_job_mode_returns_job_id_and_result(mock_memo, mock_create, env):
+    with TestClient(main.app) as client:
+        response = client.post("/analyze?mode=job&priority=5", json={"file_content": "Office in Austin, TX"})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        for _ in range(100):
+            result = client.get(f"/jobs/{job_id}").json()
+            if result["status"] == "completed":
+                break
+            time.sleep(0.01)
+        assert result["memo"] == "## Memo"
+        assert result["priority"] == 5
+        assert client.get("/jobs/unknown").status_code == 404
+
+@patch('main.create_service_clients', new_callable=AsyncMock)
+def test_analyze_job_mode_does_not_wait_for_client_warm_up(mock_create, env):
+    warm_up_done = None
+    async def slow_create():
+        nonlocal warm_up_done
+        warm_up_done = asyncio.Event()
+        await warm_up_done.wait()
+        return main.ServiceClients()
+    mock_create.side_effect = slow_create
+
+    with TestClient(main.app) as client:
+        started = time.perf_counter()
+        response = client.post("/analyze?mode=job", json={"file_content": "Office in Austin, TX"})
+        elapsed = time.perf_counter() - started
+        assert client.get("/ready").json() == {"status": "warming_up"}
+        client.portal.call(warm_up_done.set)
+
+    assert response.status_code == 202
+    assert elapsed < 1
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+def test_analyze_job_mode_returns_429_when_queue_is_full(mock_create, env, monkeypatch):
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(client.app.state.job_queue, "max_size", 0)
+        response = client.post("/analyze?mode=job", json={"file_content": "Office in Austin, TX"})
+        assert client.get("/jobs").json()["rejected"] == 1
+
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+@patch('main.create_service_clients', new_callable=AsyncMock, return_value=main.ServiceClients())
+@patch('main.get_analysis_memo', new_callable=AsyncMock)
+def test_analyze_returns_503_when_circuit_is_open(mock_memo, mock_create, env):
+    mock_memo.side_effect = main.CircuitOpenError("gemini", retry_after=12)
+    with TestClient(main.app) as client:
+        response = client.post("/analyze", json={"file_content": "Office in Austin, TX"})
+        stats = client.get("/governor/stats").json()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "12"
+    assert set(stats) == {"gemini", "bigquery"}
+
+# --- Tests for /ready ---
+
+@patch('main.create_service_clients', new_callable=AsyncMock)
+def test_health_answers_while_clients_warm_up(mock_create, env):
+    async def slow_create():
+        await asyncio.sleep(0.2)
+        return main.ServiceClients(bigquery_client=MagicMock(), analysis_chain=MagicMock())
+    mock_create.side_effect = slow_create
+
+    with TestClient(main.app) as client:
+        assert client.get("/health").status_code == 200
+        assert client.get("/ready").json() == {"status": "warming_up"}
+
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.01)
+        assert response.json() == {"status": "ready", "enrichment_client": True, "analysis_chain": True}
+
+@patch('main.create_service_clients', new_callable=AsyncMock)
+def test_ready_fails_when_a_client_could_not_be_created(mock_create, env):
+    mock_create.return_value = main.ServiceClients(bigquery_client=MagicMock(), analysis_chain=None)
+
+    with TestClient(main.app) as client:
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.json()["status"] != "warming_up":
+                break
+            time.sleep(0.01)
+
+    assert response.status_code == 503
+    assert response.json() == {"status": "failed", "enrichment_client": True, "analysis_chain": False}
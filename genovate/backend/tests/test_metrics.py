@@ -0,0 +1,68 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from prometheus_client import REGISTRY
+
+from services import metrics
+from services.analysis_service import get_analysis_memo
+from services.metrics import TokenUsageCallback, record_bigquery_bytes, request_trace, stage
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+# --- Tests for stage timing ---
+
+def test_stages_are_recorded_in_trace_and_histogram():
+    before = _sample("analysis_stage_duration_seconds_count", {"stage": "unit_test_stage"})
+    with request_trace("unit_test") as trace:
+        with stage("unit_test_stage"):
+            pass
+        record_bigquery_bytes("unit_test_table", 2048)
+
+    assert [name for name, _ in trace.spans] == ["unit_test_stage"]
+    assert trace.attributes["bigquery_bytes_processed"] == 2048
+    assert _sample("analysis_stage_duration_seconds_count", {"stage": "unit_test_stage"}) == before + 1
+    assert _sample("analysis_request_duration_seconds_count", {"operation": "unit_test"}) >= 1
+    assert _sample("analysis_bigquery_bytes_processed_total", {"table": "unit_test_table"}) >= 2048
+
+def test_slow_request_is_logged_with_stage_breakdown(monkeypatch, capsys):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 0)
+    with request_trace("unit_test"):
+        with stage("extraction"):
+            pass
+
+    output = capsys.readouterr().out
+    assert "Slow analysis request" in output
+    assert '"stage": "extraction"' in output
+
+def test_token_usage_callback_counts_tokens():
+    before = _sample("analysis_llm_tokens_total", {"direction": "output"})
+    message = AIMessage(content="memo", usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+    with request_trace("unit_test") as trace:
+        TokenUsageCallback().on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+
+    assert trace.attributes == {"llm_input_tokens": 120, "llm_output_tokens": 30}
+    assert _sample("analysis_llm_tokens_total", {"direction": "output"}) == before + 30
+
+def test_analysis_memo_trace_covers_every_stage(monkeypatch, capsys):
+    """Stages timed in worker threads and in the coalesced Gemini task belong to the request's trace."""
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 0)
+    job = MagicMock()
+    job.total_bytes_processed = 1024
+    job.result.return_value = [{'state': 'CA'}]
+    client = MagicMock()
+    client.query.return_value = job
+
+    async def ainvoke(inputs, config=None):
+        return "## Memo"
+    chain = MagicMock()
+    chain.ainvoke.side_effect = ainvoke
+
+    assert asyncio.run(get_analysis_memo("Office in Anytown, CA 90210", enrichment_client=client, chain=chain)) == "## Memo"
+
+    output = capsys.readouterr().out
+    for name in ("extraction", "bigquery.realtor_data", "serialize.realtor_data", "enrichment", "context_budget", "llm"):
+        assert f'"stage": "{name}"' in output
+    assert '"bigquery_bytes_processed": 4096' in output
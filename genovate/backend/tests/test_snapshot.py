@@ -0,0 +1,112 @@
+import os
+from unittest.mock import MagicMock
+
+import pyarrow as pa
+import pytest
+
+from services.analysis_service import _build_enrichment_queries, _fetch_bigquery_context
+from services.snapshot import SnapshotEngine, export_snapshot
+
+SOURCE_TABLES = {
+    "realtor_data": pa.table({
+        "city": ["Anytown", "Anytown", "Anytown", "Othertown"],
+        "state": ["CA", "CA", "CA", "CA"],
+        "price": [500000, 650000, 900000, 400000],
+        "beds": [2, 3, 4, 2],
+        "baths": [1, 2, 3, 1],
+        "sqft": [1000, 1100, 3000, 1000],
+    }),
+    "commercial_real_estate": pa.table({
+        "sale_price": [2000000, 3500000],
+        "city": ["Anytown", "Austin"],
+        "state": ["CA", "TX"],
+        "property_type": ["Office", "Retail"],
+        "year_built": [1999, 2010],
+    }),
+    "nfip_losses_by_state": pa.table({
+        "state": ["CA", "TX"],
+        "amount_paid_on_claims": [1200.5, 98000.0],
+    }),
+    "safmrs_revised": pa.table({
+        "state": ["CA", "CA"],
+        "risk_summary": ["old", "new"],
+        "last_updated": ["2024-01-01", "2025-01-01"],
+    }),
+}
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    client = MagicMock()
+    client.list_rows.side_effect = lambda table_id: MagicMock(to_arrow=MagicMock(return_value=SOURCE_TABLES[table_id]))
+    export_snapshot(client, str(tmp_path), {name: name for name in SOURCE_TABLES})
+    return str(tmp_path)
+
+def _table_dir(snapshot_dir, table):
+    return os.path.join(snapshot_dir, SnapshotEngine(snapshot_dir).manifest["tables"][table]["path"])
+
+def test_export_partitions_by_state(snapshot_dir):
+    assert os.path.isdir(os.path.join(_table_dir(snapshot_dir, "realtor_data"), "state=CA"))
+    assert not os.path.exists(os.path.join(_table_dir(snapshot_dir, "realtor_data"), "state=CA", "city=Anytown"))
+    assert os.path.isdir(os.path.join(_table_dir(snapshot_dir, "nfip_losses_by_state"), "state=TX"))
+
+def test_running_engine_picks_up_a_re_export(snapshot_dir):
+    """Test that a live engine serves a re-exported table, with partitions removed and added."""
+    engine = SnapshotEngine(snapshot_dir)
+    assert '"amount_paid_on_claims": 1200.5' in _fetch_bigquery_context({"state": "CA"}, client=engine)
+
+    client = MagicMock()
+    client.list_rows.return_value.to_arrow.return_value = pa.table({"state": ["NY"], "amount_paid_on_claims": [5.0]})
+    export_snapshot(client, snapshot_dir, {"nfip_losses_by_state": "nfip_losses_by_state"})
+
+    # The CA partition is gone and NY is new; the cached CA result is dropped too.
+    assert "NFIP Financial Losses Data" not in _fetch_bigquery_context({"state": "CA"}, client=engine)
+    assert '"amount_paid_on_claims": 5.0' in _fetch_bigquery_context({"state": "NY"}, client=engine)
+
+def test_export_keeps_only_current_and_previous_versions(snapshot_dir):
+    client = MagicMock()
+    client.list_rows.side_effect = lambda table_id: MagicMock(to_arrow=MagicMock(return_value=SOURCE_TABLES[table_id]))
+    for _ in range(3):
+        export_snapshot(client, snapshot_dir, {"safmrs_revised": "safmrs_revised"})
+
+    versions = [entry for entry in os.listdir(snapshot_dir) if entry.startswith("safmrs_revised")]
+    info = SnapshotEngine(snapshot_dir).manifest["tables"]["safmrs_revised"]
+    assert sorted(versions) == sorted([info["path"], info["previous_path"]])
+
+def test_export_handles_more_cities_than_pyarrow_partition_limit(tmp_path):
+    cities = [f"City {i}" for i in range(3000)]
+    realtor = pa.table({
+        "city": cities,
+        "state": ["CA"] * len(cities),
+        "price": [500000] * len(cities),
+        "beds": [2] * len(cities),
+        "baths": [1] * len(cities),
+        "sqft": [1000] * len(cities),
+    })
+    client = MagicMock()
+    client.list_rows.return_value.to_arrow.return_value = realtor
+
+    manifest = export_snapshot(client, str(tmp_path), {"realtor_data": "realtor_data"})
+    rows = SnapshotEngine(str(tmp_path)).run_query(_build_enrichment_queries({"state": "CA", "city": "City 2999"})[0])
+
+    assert manifest["tables"]["realtor_data"]["rows"] == 3000
+    assert [row["city"] for row in rows] == ["City 2999"]
+
+def test_snapshot_answers_enrichment_queries(snapshot_dir):
+    engine = SnapshotEngine(snapshot_dir)
+    details = {"state": "CA", "city": "Anytown", "property_type": "office", "sqft": 1050}
+    realtor, commercial, nfip, safmrs = [engine.run_query(q) for q in _build_enrichment_queries(details)]
+
+    assert sorted(row["price"] for row in realtor) == [500000, 650000]
+    assert commercial == [{"sale_price": 2000000, "city": "Anytown", "state": "CA", "property_type": "Office", "year_built": 1999}]
+    assert nfip == [{"state": "CA", "amount_paid_on_claims": 1200.5}]
+    assert safmrs == [{"state": "CA", "risk_summary": "new", "last_updated": "2025-01-01"}]
+
+def test_fetch_context_from_snapshot(snapshot_dir):
+    """Test that the snapshot backend plugs into the enrichment layer without a BigQuery client."""
+    result = _fetch_bigquery_context({"state": "TX", "city": "Austin"}, client=SnapshotEngine(snapshot_dir))
+
+    assert '"amount_paid_on_claims": 98000.0' in result
+    assert "Commercial Real Estate Comps" in result
+    # No realtor rows for Austin and no SAFMRS rows for TX.
+    assert "Realtor Market Data" not in result
+    assert "Internal SAFMRS Risk Data" not in result
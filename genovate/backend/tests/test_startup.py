@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Client libraries that must only be imported when the shared clients are built.
+HEAVY_MODULES = ("google.cloud.bigquery", "langchain", "langchain_core", "langchain_google_genai", "pandas", "pyarrow")
+
+
+def _import_times(statement: str) -> dict:
+    """Runs `statement` in a fresh interpreter with -X importtime and returns cumulative microseconds per module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_importing_main_does_not_import_client_libraries():
+    times = _import_times("import main")
+    print(f"import main: {times['main'] / 1000:.0f} ms")
+    heavy = sorted(name for name in times if any(name == m or name.startswith(m + ".") for m in HEAVY_MODULES))
+    assert heavy == []
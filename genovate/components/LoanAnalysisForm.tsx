@@ -6,10 +6,11 @@ import { XCircleIcon } from './icons/XCircleIcon';
 
 interface LoanAnalysisFormProps {
   onSubmit: (content: string) => void;
+  onSubmitFile: (file: File) => void;
   isLoading: boolean;
 }
 
-export const LoanAnalysisForm: React.FC<LoanAnalysisFormProps> = ({ onSubmit, isLoading }) => {
+export const LoanAnalysisForm: React.FC<LoanAnalysisFormProps> = ({ onSubmit, onSubmitFile, isLoading }) => {
   const [inputType, setInputType] = useState<'upload' | 'text'>('upload');
   const [file, setFile] = useState<File | null>(null);
   const [textInput, setTextInput] = useState('');
@@ -17,10 +18,11 @@ export const LoanAnalysisForm: React.FC<LoanAnalysisFormProps> = ({ onSubmit, is
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const handleFileChange = (selectedFile: File | null) => {
-    if (selectedFile && (selectedFile.type === 'text/plain' || selectedFile.type === 'text/csv' || selectedFile.type === 'text/markdown')) {
+    const isPdf = selectedFile?.type === 'application/pdf' || selectedFile?.name.toLowerCase().endsWith('.pdf');
+    if (selectedFile && (selectedFile.type === 'text/plain' || selectedFile.type === 'text/csv' || selectedFile.type === 'text/markdown' || isPdf)) {
       setFile(selectedFile);
     } else if (selectedFile) {
-      alert('Please upload a valid file type: .txt, .csv, or .md');
+      alert('Please upload a valid file type: .txt, .csv, .md, or .pdf');
     }
   };
 
@@ -56,12 +58,8 @@ export const LoanAnalysisForm: React.FC<LoanAnalysisFormProps> = ({ onSubmit, is
     if (isLoading) return;
 
     if (inputType === 'upload' && file) {
-      const reader = new FileReader();
-      reader.onload = (readEvent) => {
-        const content = readEvent.target?.result as string;
-        if (content.trim()) onSubmit(content);
-      };
-      reader.readAsText(file);
+      // Files are uploaded as-is and converted to text on the server.
+      onSubmitFile(file);
     } else if (inputType === 'text' && textInput.trim()) {
       onSubmit(textInput);
     }
@@ -95,7 +93,7 @@ export const LoanAnalysisForm: React.FC<LoanAnalysisFormProps> = ({ onSubmit, is
               onDragEnter={handleDragEnter} onDragLeave={handleDragLeave} onDragOver={handleDragOver} onDrop={handleDrop}
               onClick={() => fileInputRef.current?.click()}
             >
-              <input type="file" ref={fileInputRef} onChange={(e) => handleFileChange(e.target.files ? e.target.files[0] : null)} className="hidden" accept=".txt,.csv,.md" disabled={isLoading} />
+              <input type="file" ref={fileInputRef} onChange={(e) => handleFileChange(e.target.files ? e.target.files[0] : null)} className="hidden" accept=".txt,.csv,.md,.pdf" disabled={isLoading} />
               <div className="flex flex-col items-center justify-center space-y-2 text-gray-400">
                 <DocumentArrowUpIcon className="h-10 w-10" />
                 <p className="font-semibold text-gray-300">Drag & drop your data file here</p>
@@ -1,6 +1,13 @@
-
+import argparse
+import fnmatch
+import hashlib
+import json
 import os
-import zipfile
+import struct
+import sys
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Configuration ---
 ZIP_FILENAME = 'cre_analyst_app.zip'
@@ -25,49 +32,259 @@ FILES_AND_DIRS_TO_ZIP = [
     # Backend directory
     'backend/',
 ]
+# Paths matching any of these globs are never packaged: secrets, caches, build and
+# test artifacts. A pattern without a "/" is matched against every path component.
+EXCLUDE_PATTERNS = [
+    '.env',
+    '.env.*',
+    '__pycache__',
+    '*.pyc',
+    '.pytest_cache',
+    '.benchmarks',
+    '.mypy_cache',
+    '.git',
+    'node_modules',
+    'dist',
+    'build',
+    'snapshots',
+    '*.db',
+    '*.zip',
+    '*.log',
+    '.DS_Store',
+]
+# Compressed copies of every packaged file, keyed by content hash, plus the manifest.
+CACHE_DIR = '.package_cache'
+COMPRESSION_LEVEL = 9
+
+# Every entry gets the same timestamp (1980-01-01 00:00, the earliest a zip can
+# store), so the archive only changes when file contents do.
+_DOS_TIME = 0
+_DOS_DATE = (0 << 9) | (1 << 5) | 1
+_ZIP_VERSION = 20
+
+
+def _matches(path, patterns):
+    parts = path.split('/')
+    for pattern in patterns:
+        if '/' in pattern:
+            if fnmatch.fnmatch(path, pattern):
+                return True
+        elif any(fnmatch.fnmatch(part, pattern) for part in parts):
+            return True
+    return False
+
+
+def collect_files(items, include_patterns, exclude_patterns):
+    """
+    Returns the sorted archive paths (with "/" separators) of the files to package.
+    `include_patterns`, when given, must also match each path.
+    """
+    paths = set()
+    for item in items:
+        if not os.path.exists(item):
+            print(f"Warning: Item not found and will be skipped: {item}")
+            continue
+        if os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = []
+            for root, dirs, files in os.walk(item):
+                # Prune excluded directories instead of walking into them.
+                rel_root = os.path.relpath(root).replace(os.sep, '/')
+                dirs[:] = [d for d in dirs if not _matches(f"{rel_root}/{d}", exclude_patterns)]
+                candidates.extend(os.path.join(root, f) for f in files)
+        for candidate in candidates:
+            path = os.path.relpath(candidate).replace(os.sep, '/')
+            if _matches(path, exclude_patterns):
+                continue
+            if include_patterns and not any(fnmatch.fnmatch(path, pattern) for pattern in include_patterns):
+                continue
+            paths.add(path)
+    return sorted(paths)
+
 
-def zip_project(zip_filename, items_to_zip):
+class BlobCache:
     """
-    Creates a zip archive of the specified files and directories.
+    Raw-deflate compressed file contents stored by content hash, with a manifest
+    that also remembers each path's size and mtime so unchanged files are not even
+    re-hashed on the next run.
+    """
+
+    def __init__(self, directory, level):
+        self.directory = directory
+        self.level = level
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get('level') != level:
+            manifest = {}
+        self.files = manifest.get('files', {})
+        self.blobs = manifest.get('blobs', {})
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', f"{digest}.deflate")
+
+    def prepare(self, path):
+        """
+        Returns (digest, blob info, recompressed) for one file, compressing it only if
+        no blob exists for its contents. Safe to call from several threads at once.
+        """
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            digest = known['sha256']
+            if digest in self.blobs and os.path.exists(self.blob_path(digest)):
+                return digest, self.blobs[digest], False
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        self.files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        info = self.blobs.get(digest)
+        if info is not None and os.path.exists(self.blob_path(digest)):
+            return digest, info, False
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        # Store incompressible files as is; deflating them would only make them bigger.
+        method = 8 if len(compressed) < len(data) else 0
+        payload = compressed if method == 8 else data
+        # Files with identical contents may be compressed by two threads at once, so
+        # each writes its own temporary file; either one can win the rename.
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(self.blob_path(digest)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.blob_path(digest))
+        info = {'crc32': zlib.crc32(data), 'size': len(data), 'compressed_size': len(payload), 'method': method}
+        self.blobs[digest] = info
+        return digest, info, True
+
+    def save(self, paths, digests):
+        """Writes the manifest for the packaged `paths` and removes blobs nobody references."""
+        self.files = {path: self.files[path] for path in paths}
+        self.blobs = {digest: self.blobs[digest] for digest in set(digests)}
+        for name in os.listdir(os.path.join(self.directory, 'blobs')):
+            if name.split('.')[0] not in self.blobs:
+                os.remove(os.path.join(self.directory, 'blobs', name))
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'level': self.level, 'files': self.files, 'blobs': self.blobs}, f, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def write_zip(zip_filename, entries, cache):
+    """
+    Writes a zip archive from precompressed blobs. `entries` are (archive path,
+    source path, digest, blob info) in archive order. Timestamps are fixed, so the
+    same inputs always produce byte-identical output.
+    """
+    if len(entries) >= 0xFFFF:
+        raise ValueError("Too many files for a zip archive without ZIP64 support.")
+
+    central = []
+    tmp_path = f"{zip_filename}.tmp"
+    with open(tmp_path, 'wb') as out:
+        for name, source, digest, info in entries:
+            if info['size'] >= 0xFFFFFFFF or out.tell() >= 0xFFFFFFFF:
+                raise ValueError("Archive is too large for a zip archive without ZIP64 support.")
+            encoded = name.encode('utf-8')
+            flags = 0x800 if not name.isascii() else 0
+            offset = out.tell()
+            out.write(struct.pack(
+                '<IHHHHHIIIHH', 0x04034B50, _ZIP_VERSION, flags, info['method'], _DOS_TIME, _DOS_DATE,
+                info['crc32'], info['compressed_size'], info['size'], len(encoded), 0,
+            ))
+            out.write(encoded)
+            with open(cache.blob_path(digest), 'rb') as blob:
+                while True:
+                    chunk = blob.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            mode = 0o755 if os.access(source, os.X_OK) else 0o644
+            central.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014B50, (3 << 8) | _ZIP_VERSION, _ZIP_VERSION, flags, info['method'],
+                _DOS_TIME, _DOS_DATE, info['crc32'], info['compressed_size'], info['size'], len(encoded),
+                0, 0, 0, 0, (0o100000 | mode) << 16, offset,
+            ) + encoded)
+
+        directory_offset = out.tell()
+        for record in central:
+            out.write(record)
+        directory_size = out.tell() - directory_offset
+        out.write(struct.pack(
+            '<IHHHHIIH', 0x06054B50, 0, 0, len(central), len(central), directory_size, directory_offset, 0,
+        ))
+    os.replace(tmp_path, zip_filename)
+
+
+def zip_project(zip_filename, items_to_zip, include_patterns=None, exclude_patterns=EXCLUDE_PATTERNS,
+                cache_dir=CACHE_DIR, level=COMPRESSION_LEVEL, jobs=None, verbose=False):
+    """
+    Creates a reproducible zip archive of the specified files and directories.
+    Only files whose contents changed since the last run are recompressed, and
+    those are compressed in parallel. Returns True on success.
     """
     print(f"Creating zip archive: {zip_filename}")
-    
+
     try:
-        with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for item in items_to_zip:
-                if not os.path.exists(item):
-                    print(f"Warning: Item not found and will be skipped: {item}")
-                    continue
-
-                if os.path.isdir(item):
-                    print(f"Adding directory: {item}")
-                    for root, dirs, files in os.walk(item):
-                        # Exclude __pycache__ directories and .env files
-                        if '__pycache__' in root:
-                            continue
-                        
-                        # Exclude .env file for security
-                        files_to_archive = [f for f in files if f != '.env']
-
-                        for file in files_to_archive:
-                            file_path = os.path.join(root, file)
-                            archive_path = os.path.join(root, file)
-                            print(f"  - Adding file: {file_path}")
-                            zipf.write(file_path, archive_path)
-                elif os.path.isfile(item):
-                    print(f"Adding file: {item}")
-                    zipf.write(item, item)
+        excludes = list(exclude_patterns) + [zip_filename, cache_dir.rstrip('/')]
+        paths = collect_files(items_to_zip, include_patterns or [], excludes)
+        cache = BlobCache(cache_dir, level)
+
+        # zlib releases the GIL while compressing, so threads compress files in parallel.
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            prepared = list(pool.map(cache.prepare, paths))
+
+        entries = [(path, path, digest, info) for path, (digest, info, _) in zip(paths, prepared)]
+        write_zip(zip_filename, entries, cache)
+        cache.save(paths, [digest for digest, _, _ in prepared])
+
+        recompressed = sum(1 for _, _, changed in prepared if changed)
+        if verbose:
+            for path, (_, info, changed) in zip(paths, prepared):
+                print(f"  {'compressed' if changed else 'cached    '} {path} ({info['size']} bytes)")
 
         print("-" * 20)
-        print(f"Successfully created {zip_filename}")
+        print(f"Successfully created {zip_filename}: {len(paths)} files, "
+              f"{recompressed} recompressed, {len(paths) - recompressed} reused from {cache_dir}")
         print("You can now download and distribute this file.")
         print("-" * 20)
+        return True
 
     except Exception as e:
         print(f"An error occurred while creating the zip file: {e}")
+        return False
 
 if __name__ == '__main__':
     # To run this script:
     # 1. Make sure you are in the root directory of the project.
     # 2. Run `python download.py` in your terminal.
-    zip_project(ZIP_FILENAME, FILES_AND_DIRS_TO_ZIP)
+    #    Use --exclude/--include to add globs, e.g. --exclude 'backend/tests/*', and
+    #    --verbose to list every packaged file.
+    parser = argparse.ArgumentParser(description="Package the project into a reproducible zip archive.")
+    parser.add_argument("--output", default=ZIP_FILENAME)
+    parser.add_argument("--include", action="append", default=[], help="Only package paths matching this glob (repeatable).")
+    parser.add_argument("--exclude", action="append", default=[], help="Also exclude paths matching this glob (repeatable).")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--level", type=int, default=COMPRESSION_LEVEL, choices=range(1, 10))
+    parser.add_argument("--jobs", type=int, default=None, help="Compression threads (default: one per CPU, plus four).")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    succeeded = zip_project(
+        args.output,
+        FILES_AND_DIRS_TO_ZIP,
+        include_patterns=args.include,
+        exclude_patterns=EXCLUDE_PATTERNS + args.exclude,
+        cache_dir=args.cache_dir,
+        level=args.level,
+        jobs=args.jobs,
+        verbose=args.verbose,
+    )
+    # A non-zero exit status lets CI fail instead of keeping a stale archive.
+    sys.exit(0 if succeeded else 1)
@@ -1,25 +1,27 @@
 
 import { useState, useCallback } from 'react';
-import { analyzeDataWithAPI } from '../services/apiService';
+import { streamAnalysisWithAPI, streamFileAnalysisWithAPI } from '../services/apiService';
 
 export const useLoanAnalyzer = () => {
   const [memoData, setMemoData] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState<boolean>(false);
+  const [isStreaming, setIsStreaming] = useState<boolean>(false);
   const [error, setError] = useState<string | null>(null);
 
-  const analyzeData = useCallback(async (fileContent: string) => {
-    if (!fileContent.trim()) {
-      setError("The uploaded file is empty or could not be read.");
-      return;
-    }
-
+  const runAnalysis = useCallback(async (stream: (onChunk: (chunk: string) => void) => Promise<string>) => {
     setIsLoading(true);
+    setIsStreaming(false);
     setError(null);
     setMemoData(null);
 
     try {
-      const result = await analyzeDataWithAPI(fileContent);
-      setMemoData(result.memo);
+      // Render the memo as it arrives; the loading indicator is only shown
+      // until the first chunk (i.e. while the data is being enriched).
+      await stream((chunk) => {
+        setIsLoading(false);
+        setIsStreaming(true);
+        setMemoData((previous) => (previous ?? '') + chunk);
+      });
     } catch (e: unknown) {
       if (e instanceof Error) {
         setError(e.message);
@@ -28,8 +30,25 @@ export const useLoanAnalyzer = () => {
       }
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   }, []);
 
-  return { memoData, isLoading, error, analyzeData };
+  const analyzeData = useCallback(async (fileContent: string) => {
+    if (!fileContent.trim()) {
+      setError("The uploaded file is empty or could not be read.");
+      return;
+    }
+    await runAnalysis((onChunk) => streamAnalysisWithAPI(fileContent, onChunk));
+  }, [runAnalysis]);
+
+  const analyzeFile = useCallback(async (file: File) => {
+    if (file.size === 0) {
+      setError("The uploaded file is empty or could not be read.");
+      return;
+    }
+    await runAnalysis((onChunk) => streamFileAnalysisWithAPI(file, onChunk));
+  }, [runAnalysis]);
+
+  return { memoData, isLoading, isStreaming, error, analyzeData, analyzeFile };
 };
@@ -1,37 +1,113 @@
-
-interface AnalysisResponse {
-  memo: string;
-}
-
 // This URL is a placeholder and will be replaced by the deploy.sh script on the server.
 // For local development, it points to the local backend server.
 const API_BASE_URL = 'http://127.0.0.1:8000';
 
-export const analyzeDataWithAPI = async (fileContent: string): Promise<AnalysisResponse> => {
+/**
+ * Reads a Server-Sent Events memo stream, invoking `onChunk` with each piece of
+ * the memo. Resolves with the complete memo once the stream ends.
+ */
+const readMemoStream = async (response: Response, onChunk: (chunk: string) => void): Promise<string> => {
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({ detail: 'An unknown API error occurred.' }));
+    throw new Error(errorData.detail || `API request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let memo = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Server-Sent Events are separated by a blank line.
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let eventType = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) eventType = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      const payload = data ? JSON.parse(data) : {};
+
+      if (eventType === 'error') {
+        throw new Error(payload.detail || 'An unknown API error occurred.');
+      }
+      if (eventType === 'done') {
+        return memo;
+      }
+      if (payload.delta) {
+        memo += payload.delta;
+        onChunk(payload.delta);
+      }
+    }
+  }
+
+  return memo;
+};
+
+const toFriendlyError = (error: unknown): Error => {
+  console.error("Error calling streaming analysis API:", error);
+  if (error instanceof Error) {
+    if (error.message.includes('Failed to fetch')) {
+      return new Error('Could not connect to the analysis server. Please ensure the backend is running and check the README.md for setup instructions.');
+    }
+    return error;
+  }
+  return new Error("An unknown error occurred while communicating with the API.");
+};
+
+/**
+ * Calls the streaming endpoint and invokes `onChunk` with each piece of the memo
+ * as it is generated. Resolves with the complete memo once the stream ends.
+ */
+export const streamAnalysisWithAPI = async (
+  fileContent: string,
+  onChunk: (chunk: string) => void,
+): Promise<string> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/analyze`, {
+    const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
       },
       body: JSON.stringify({ file_content: fileContent }),
     });
+    return await readMemoStream(response, onChunk);
+  } catch (error) {
+    throw toFriendlyError(error);
+  }
+};
 
-    if (!response.ok) {
-      const errorData = await response.json().catch(() => ({ detail: 'An unknown API error occurred.' }));
-      throw new Error(errorData.detail || `API request failed with status ${response.status}`);
-    }
-
-    return await response.json() as AnalysisResponse;
+/**
+ * Uploads a file (.txt, .md, .csv or .pdf) as multipart form data, so the browser
+ * never has to read it into a string, and streams the memo back like
+ * `streamAnalysisWithAPI`.
+ */
+export const streamFileAnalysisWithAPI = async (
+  file: File,
+  onChunk: (chunk: string) => void,
+): Promise<string> => {
+  try {
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await fetch(`${API_BASE_URL}/analyze/upload?stream=true`, {
+      method: 'POST',
+      headers: {
+        'Accept': 'text/event-stream',
+      },
+      body: formData,
+    });
+    return await readMemoStream(response, onChunk);
   } catch (error) {
-    console.error("Error calling analysis API:", error);
-    if (error instanceof Error) {
-      // Prepend a user-friendly message for network errors
-      if (error.message.includes('Failed to fetch')) {
-        throw new Error('Could not connect to the analysis server. Please ensure the backend is running and check the README.md for setup instructions.');
-      }
-      throw error;
-    }
-    throw new Error("An unknown error occurred while communicating with the API.");
+    throw toFriendlyError(error);
   }
 };